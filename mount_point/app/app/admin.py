@@ -30,3 +30,13 @@ class QualityValidationResultAdmin(admin.ModelAdmin):
     list_display = ('sensor', 'date', 'test', 'passed')
 
 admin.site.register(app.models.QualityValidationResult, QualityValidationResultAdmin)
+
+class QualityRecomputationJobAdmin(admin.ModelAdmin):
+    list_display = ('sensor', 'requestedAt', 'startedAt', 'dateFrom', 'dateTo')
+
+admin.site.register(app.models.QualityRecomputationJob, QualityRecomputationJobAdmin)
+
+class SensorTrackSummaryAdmin(admin.ModelAdmin):
+    list_display = ('sensor', 'firstDate', 'lastDate', 'totalDays', 'allTestsPassedDays')
+
+admin.site.register(app.models.SensorTrackSummary, SensorTrackSummaryAdmin)
@@ -0,0 +1,159 @@
+from django.db import models
+
+import threading
+import holidays
+import numpy as np
+from dateutil.parser import parse
+from datetime import datetime
+
+import app.models
+from app.trackSeries import TrackSeries, HourlyTrackSeries, toDays
+
+# TODO: avoid the hardcoded year
+BE_HOLIDAYS = [holiday[0] for holiday in holidays.Belgium (years=[2021]).items()]
+BE_HOLIDAY_DAYS = toDays (BE_HOLIDAYS)
+
+# day names of the timePeriods, in the order of the week_day lookup of Django (Sunday first)
+WEEK_DAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+# quality tests that the timePeriods can use to filter out the failing days
+FILTERING_TESTS = ['PerformanceThreshold', 'MinThreshold', 'DBSCAN']
+
+# parse datetime from and to objects from timePeriods coming from the API request
+def getFromToFromTimePeriod (timePeriod):
+    try:
+        tpFrom = parse (str(timePeriod['from'])) if isinstance(timePeriod['from'], str) else  datetime.fromtimestamp (timePeriod['from']/ 1000)
+    except:
+        tpFrom = None
+    try:
+        tpTo = parse (str(timePeriod['to'])) if isinstance(timePeriod['to'], str) else  datetime.fromtimestamp (timePeriod['to']/ 1000)
+    except:
+        tpTo = None
+    return tpFrom, tpTo
+
+# configuration of a timePeriod (dates / day types / holidays / tests passed), applied in memory to the measurements loaded by MeasurementsLoader
+# same rules as views.filterMeasurementsForTimePeriod; the bounds are converted to dates the way the DateField lookups do
+class TimeWindow:
+    def __init__ (self, timePeriod):
+        tpFrom, tpTo = getFromToFromTimePeriod (timePeriod)
+        self.dateFrom = models.DateField ().to_python (tpFrom)
+        self.dateTo = models.DateField ().to_python (tpTo)
+        self.weekDays = [dayCounter for dayCounter, day in enumerate (WEEK_DAYS) if timePeriod[day]]
+        self.holiday = timePeriod['Holiday']
+        self.nonHoliday = timePeriod['Non-holiday']
+        self.failingTestIds = [app.models.qualityValidationTestRegistry.id (testName) for testName in FILTERING_TESTS if not timePeriod[testName]]
+        self.failingTestIds = [testId for testId in self.failingTestIds if testId]
+
+    # boolean mask of the days (datetime64[D] array) belonging to the time window
+    # failedTestDays is the testId -> datetime64[D] array dictionary of the failed tests of the track
+    def mask (self, days, failedTestDays):
+        res = (days >= np.datetime64 (self.dateFrom)) & (days <= np.datetime64 (self.dateTo))
+        #the 1970-01-01 epoch is a Thursday, thus (day index + 4) % 7 counts the days from Sunday like WEEK_DAYS
+        res &= np.isin ((days.astype ('int64') + 4) % 7, self.weekDays)
+        isHoliday = np.isin (days, BE_HOLIDAY_DAYS)
+        if not self.holiday:
+            res &= ~isHoliday
+        if not self.nonHoliday:
+            res &= isHoliday
+        for testId in self.failingTestIds:
+            res &= ~np.isin (days, failedTestDays[testId])
+        return res
+
+# loader of the measurements of all the sensor tracks and time windows of an analysis request
+# instead of a query per (track, time window), the daily and hourly measurements of the tracks are fetched over the union of the time windows
+# with a single query per table (and one for the failed quality tests), as TrackSeries / HourlyTrackSeries; the time windows and hours are then sliced as arrays
+# the tables are loaded on first use, tracks added later (e.g. the base population sensor) are loaded together at the next use
+# a loader can be shared by the views computed in parallel for the same request: its state is only accessed under its lock
+class MeasurementsLoader:
+    def __init__ (self, cTs, timePeriods):
+        self.windows = [TimeWindow (timePeriod) for timePeriod in timePeriods]
+        self.dateFrom = min (w.dateFrom for w in self.windows) if self.windows else None
+        self.dateTo = max (w.dateTo for w in self.windows) if self.windows else None
+        self.failingTestIds = sorted (set (testId for w in self.windows for testId in w.failingTestIds))
+        self.tracks = {}
+        self.daily = {}
+        self.hourly = {}
+        self.failedTestDays = {}
+        self.windowMasks = {}
+        self.windowSeries = {}
+        self.memo = {}
+        self.lock = threading.RLock ()
+        self.addTracks (cTs)
+
+    def addTracks (self, cTs):
+        with self.lock:
+            for cT in cTs:
+                self.tracks[cT.id] = cT
+
+    # daily series of the track in the time window, field being either 'count_sum' (total count) or 'count' (number of hourly measurements)
+    def getDaily (self, cT, timePeriodCounter, field = 'count_sum'):
+        with self.lock:
+            mask = self.getWindowMask ('daily', cT, timePeriodCounter)
+            days, values = self.loadDaily ()[cT.id]
+        return TrackSeries (days[mask], values[field][mask])
+
+    # HourlyTrackSeries of the track in the time window (without the NaN counts)
+    # TrackSeries of the given hour if hour is set
+    def getHourly (self, cT, timePeriodCounter, hour = None):
+        key = ('hourly', cT.id, timePeriodCounter)
+        with self.lock:
+            if key not in self.windowSeries:
+                mask = self.getWindowMask ('hourly', cT, timePeriodCounter)
+                self.windowSeries[key] = self.loadHourly ()[cT.id].select (mask)
+            series = self.windowSeries[key]
+        if hour is None:
+            return series
+        return series.hour (hour)
+
+    def getWindowMask (self, kind, cT, timePeriodCounter):
+        key = (kind, cT.id, timePeriodCounter)
+        with self.lock:
+            if key not in self.windowMasks:
+                self.addTracks ([cT])
+                days = self.loadDaily ()[cT.id][0] if kind == 'daily' else self.loadHourly ()[cT.id].days
+                self.windowMasks[key] = self.windows[timePeriodCounter].mask (days, self.loadFailedTestDays ()[cT.id])
+            return self.windowMasks[key]
+
+    # value computed once per loader with build() (e.g. the base population series), shared by the views using the loader
+    def memoize (self, key, build):
+        with self.lock:
+            if key not in self.memo:
+                self.memo[key] = build ()
+            return self.memo[key]
+
+    def getPendingTrackIds (self, loaded):
+        return [trackId for trackId in self.tracks if trackId not in loaded]
+
+    # trackId -> (days, {'count': counts, 'count_sum': count sums})
+    def loadDaily (self):
+        pending = self.getPendingTrackIds (self.daily)
+        if pending:
+            rows = {trackId: [] for trackId in pending}
+            for trackId, date, count, countSum in app.models.DMeasurement.objects.filter (sensor_id__in = pending).filter (date__gte = self.dateFrom).filter (date__lte = self.dateTo).order_by ('sensor_id', 'date').values_list ('sensor_id', 'date', 'count', 'count_sum'):
+                rows[trackId].append ((date, count, countSum))
+            for trackId, trackRows in rows.items ():
+                self.daily[trackId] = (toDays ([r[0] for r in trackRows]), {'count': np.array ([r[1] for r in trackRows], dtype=int), 'count_sum': np.array ([r[2] for r in trackRows], dtype=float)})
+        return self.daily
+
+    # trackId -> HourlyTrackSeries
+    def loadHourly (self):
+        pending = self.getPendingTrackIds (self.hourly)
+        if pending:
+            rows = {trackId: [] for trackId in pending}
+            for trackId, date, hour, count in app.models.HMeasurement.objects.filter (sensor_id__in = pending).filter (date__gte = self.dateFrom).filter (date__lte = self.dateTo).exclude (count = float('nan')).values_list ('sensor_id', 'date', 'hour', 'count'):
+                rows[trackId].append ((date, hour, count))
+            for trackId, trackRows in rows.items ():
+                self.hourly[trackId] = HourlyTrackSeries.fromColumns (toDays ([r[0] for r in trackRows]), np.array ([r[1] for r in trackRows], dtype=int), np.array ([r[2] for r in trackRows], dtype=float))
+        return self.hourly
+
+    # trackId -> testId -> datetime64[D] array of the days with the test failed, for the tests used to filter the time windows
+    def loadFailedTestDays (self):
+        pending = self.getPendingTrackIds (self.failedTestDays)
+        if pending:
+            failedDates = {trackId: {testId: [] for testId in self.failingTestIds} for trackId in pending}
+            if self.failingTestIds:
+                for trackId, testId, date in app.models.QualityValidationResult.objects.filter (sensor_id__in = pending).filter (passed = False).filter (test_id__in = self.failingTestIds).filter (date__gte = self.dateFrom).filter (date__lte = self.dateTo).values_list ('sensor_id', 'test_id', 'date'):
+                    failedDates[trackId][testId].append (date)
+            for trackId, testDates in failedDates.items ():
+                self.failedTestDays[trackId] = {testId: toDays (dates) for testId, dates in testDates.items ()}
+        return self.failedTestDays
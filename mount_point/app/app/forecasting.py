@@ -0,0 +1,256 @@
+import os
+import sys
+import time
+import pickle
+import hashlib
+import tempfile
+import traceback
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import itertools
+import numpy as np
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+# fitting of the extrapolation models of the analysis views (see views.getSSExtrapolationView / getMSExtrapolationView) in a pool of worker processes
+# the fits of a request run in parallel on several cores instead of one after another in the web server thread
+# this module doesn't import Django nor the app models: the worker processes are spawned and only import it (with statsmodels)
+
+# number of worker processes, shared by all the requests of a web server process
+FORECAST_PROCESSES = max (1, min (4, (os.cpu_count () or 1) - 1))
+
+# wall-clock budget (in seconds) of a single model fit, the optimization is stopped beyond it
+FIT_TIME_BUDGET = 30
+
+# maximum wait (in seconds) for all the fits of a request, the fits not done by then (e.g. still queued behind other requests) are reported as timed out
+FIT_WAIT_TIMEOUT = 90
+
+# directory of the fitted models cache, shared by the worker processes (and the web server processes of the host)
+FITTED_MODELS_DIR = os.environ.get ('fittedModelsDir', os.path.join (tempfile.gettempdir (), 'cf_fitted_models'))
+
+# total size (in bytes) of the fitted models cache, the least recently used models are removed beyond it
+FITTED_MODELS_MAX_SIZE = 100 * 1024 * 1024
+
+# number of earlier fits of the same model kept per warm start key
+WARM_START_FITS = 10
+
+# models of the extrapolation views, as SARIMAX keyword arguments
+WEEKLY_SARIMAX = {'order': (0,1,0), 'seasonal_order': (1,1,1,7)}
+NON_SEASONAL_ARIMA = {'order': (0,1,0)}
+
+# engines of the single track extrapolation: SARIMAX (one model fitted per track in the worker processes)
+# or the exponential smoothing engines below, fitting all the tracks at once in the calling process
+SARIMAX_ENGINE = 'sarimax'
+HOLT_WINTERS_ENGINE = 'holtWinters'
+SEASONAL_NAIVE_ENGINE = 'seasonalNaive'
+EXTRAPOLATION_ENGINES = [SARIMAX_ENGINE, HOLT_WINTERS_ENGINE, SEASONAL_NAIVE_ENGINE]
+
+# smoothing parameters (level / trend / season) tried by the Holt-Winters engine, the combination with the smallest one-step-ahead error is kept per track
+HOLT_WINTERS_GRID = {'alpha': [0.1, 0.3, 0.6], 'beta': [0, 0.05], 'gamma': [0.1, 0.3, 0.6]}
+
+# the seasonal naive forecast (value of the same weekday in the last week) is the Holt-Winters model with a frozen level and a season replaced by each observation
+SEASONAL_NAIVE_PARAMS = {'alpha': 0, 'beta': 0, 'gamma': 1}
+
+WEEK_PERIOD = 7
+
+class FitTimeout (Exception):
+    pass
+
+
+# fits the model (spec being SARIMAX keyword arguments) on the series (pandas series with a daily DatetimeIndex) and predicts it from start to end ("%Y-%m-%d" strings)
+# exog and predictExog are the exogenous DataFrames of the fit and of the prediction, if any
+# if cacheKey is set, the fitted parameters are stored in the fitted models cache, and the optimization is skipped when the key is found there
+# (the model is then only filtered with the cached parameters before the prediction)
+# the key is expected to identify the training data (e.g. tracks, their data versions and the training time window) and the spec
+# warmStartKey identifies the same model regardless of the training dates and data versions: when the model has to be fitted,
+# the optimization starts from the parameters of the earlier fit with the closest training end (e.g. a rolling window moved by a few days, or a few new days of counts)
+# runs in the worker processes; returns the prediction (pandas series), or None if the fit took more than timeBudget seconds
+def fitAndPredict (series, spec, start, end, exog = None, predictExog = None, timeBudget = FIT_TIME_BUDGET, cacheKey = None, warmStartKey = None):
+    model = SARIMAX (series, exog=exog, freq='D', **spec)
+    params = loadFittedParams (cacheKey) if cacheKey else None
+    if params is not None:
+        results = model.filter (params)
+    else:
+        deadline = time.monotonic () + timeBudget
+        def checkDeadline (params):
+            if time.monotonic () > deadline:
+                raise FitTimeout ()
+        startParams = loadWarmStartParams (warmStartKey, series.index[-1], len (model.start_params)) if warmStartKey else None
+        try:
+            results = model.fit (disp=0, callback=checkDeadline, start_params=startParams)
+        except FitTimeout:
+            return None
+        if cacheKey:
+            saveFittedParams (cacheKey, results.params)
+        if warmStartKey:
+            saveWarmStartParams (warmStartKey, series.index[-1], results.params)
+    return results.predict (start=start, end=end, exog=predictExog)
+
+# fitted models cache: a pickle file per model on the local disk (with its estimated parameters, the full results being several MB), named after the hash of its key
+# the modification time of the files is updated when they are read, the files least recently used are removed first when the cache exceeds FITTED_MODELS_MAX_SIZE
+
+def getFittedModelPath (cacheKey):
+    return os.path.join (FITTED_MODELS_DIR, hashlib.sha256 (cacheKey.encode ('utf-8')).hexdigest () + '.pickle')
+
+def loadFittedParams (cacheKey):
+    path = getFittedModelPath (cacheKey)
+    try:
+        with open (path, 'rb') as f:
+            params = pickle.load (f)
+        os.utime (path)
+        return params
+    except FileNotFoundError:
+        return None
+    except Exception:
+        #truncated / incompatible file, refitted and replaced
+        return None
+
+# a model that can't be written (e.g. disk full) is just not cached
+def saveFittedParams (cacheKey, params):
+    path = getFittedModelPath (cacheKey)
+    #written aside and then renamed, as the cache is shared by several processes
+    tmpPath = path + '.' + str (os.getpid ()) + '.tmp'
+    try:
+        os.makedirs (FITTED_MODELS_DIR, exist_ok=True)
+        with open (tmpPath, 'wb') as f:
+            pickle.dump (params, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace (tmpPath, path)
+        evictFittedModels ()
+    except OSError:
+        print (traceback.format_exc ())
+        if os.path.exists (tmpPath):
+            os.remove (tmpPath)
+
+# the warm start entries are stored in the same cache, as a list of (training end, parameters) of the last WARM_START_FITS fits of the model
+
+# parameters of the fit with the training end the closest to trainingEnd (the earlier ones first), None if there isn't any with paramsCount parameters
+def loadWarmStartParams (warmStartKey, trainingEnd, paramsCount):
+    fits = [fit for fit in (loadFittedParams ('warmStart:' + warmStartKey) or []) if len (fit[1]) == paramsCount]
+    if len (fits) == 0:
+        return None
+    return min (fits, key=lambda fit: (fit[0] > trainingEnd, abs (fit[0] - trainingEnd)))[1]
+
+def saveWarmStartParams (warmStartKey, trainingEnd, params):
+    fits = [fit for fit in (loadFittedParams ('warmStart:' + warmStartKey) or []) if fit[0] != trainingEnd]
+    fits.append ((trainingEnd, params))
+    saveFittedParams ('warmStart:' + warmStartKey, sorted (fits, key=lambda fit: fit[0])[-WARM_START_FITS:])
+
+def evictFittedModels ():
+    files = []
+    for entry in os.scandir (FITTED_MODELS_DIR):
+        if entry.name.endswith ('.pickle'):
+            try:
+                stat = entry.stat ()
+            except FileNotFoundError:
+                continue
+            files.append ((stat.st_mtime, stat.st_size, entry.path))
+    size = sum (f[1] for f in files)
+    if size <= FITTED_MODELS_MAX_SIZE:
+        return
+    #removing down to 90% of the maximum size, not to scan the directory again at the next save
+    for mtime, fileSize, path in sorted (files):
+        if size <= FITTED_MODELS_MAX_SIZE * 0.9:
+            break
+        try:
+            os.remove (path)
+        except FileNotFoundError:
+            pass
+        size -= fileSize
+
+executor = None
+executorLock = threading.Lock ()
+
+def getExecutor ():
+    global executor
+    with executorLock:
+        if executor is None:
+            context = multiprocessing.get_context ('spawn')
+            #under mod_wsgi, sys.executable is the web server and not the Python interpreter
+            if not os.path.basename (sys.executable).startswith ('python'):
+                context.set_executable (os.path.join (sys.exec_prefix, 'bin', 'python3'))
+            executor = ProcessPoolExecutor (max_workers=FORECAST_PROCESSES, mp_context=context)
+        return executor
+
+# a worker process that died (e.g. killed when out of memory) breaks the pool, a new one is created for the next fits
+def resetExecutor (brokenExecutor):
+    global executor
+    with executorLock:
+        if executor is brokenExecutor:
+            executor = None
+    brokenExecutor.shutdown (wait=False, cancel_futures=True)
+
+# runs the fits (list of fitAndPredict keyword arguments) in the worker processes
+# returns their predictions in the same order, None for the fits that timed out
+def fitAndPredictAll (fits):
+    if len (fits) == 0:
+        return []
+    pool = getExecutor ()
+    try:
+        futures = [pool.submit (fitAndPredict, **dict ({'timeBudget': FIT_TIME_BUDGET}, **fit)) for fit in fits]
+        done, notDone = wait (futures, timeout=FIT_WAIT_TIMEOUT)
+        for future in notDone:
+            future.cancel ()
+        return [future.result () if future in done else None for future in futures]
+    except BrokenProcessPool:
+        resetExecutor (pool)
+        raise
+
+# additive Holt-Winters with a weekly season, vectorized over the tracks: values is a tracks x days array of daily values on a common date axis,
+# with NaN for the missing days (including the days before the start or after the end of a track); the missing days are replaced by their prediction
+# each track is initialized from its first week of values; alpha, beta and gamma are scalars or arrays (a value per track)
+# returns the tracks x (days + horizon) array of the one-step-ahead predictions over the axis followed by the forecast of the horizon days after it
+def holtWintersPredict (values, horizon, alpha, beta, gamma):
+    values = np.asarray (values, dtype=float)
+    tracks, days = values.shape
+    rows = np.arange (tracks)
+    observed = ~np.isnan (values)
+    starts = np.where (observed.any (axis=1), observed.argmax (axis=1), days)
+    firstWeek = values[rows[:, None], np.minimum (starts[:, None] + np.arange (WEEK_PERIOD), days - 1)]
+    firstWeek[starts[:, None] + np.arange (WEEK_PERIOD) >= days] = np.nan
+    with np.errstate (invalid='ignore'):
+        level = np.nan_to_num (np.nanmean (np.where (np.isnan (firstWeek).all (axis=1)[:, None], 0, firstWeek), axis=1))
+    trend = np.zeros (tracks)
+    #the season is indexed by the position of the days on the axis (modulo the period)
+    season = np.zeros ((tracks, WEEK_PERIOD))
+    season[rows[:, None], (starts[:, None] + np.arange (WEEK_PERIOD)) % WEEK_PERIOD] = np.nan_to_num (firstWeek - level[:, None])
+    res = np.full ((tracks, days + horizon), np.nan)
+    for day in range (days):
+        s = season[:, day % WEEK_PERIOD]
+        prediction = level + trend + s
+        res[:, day] = prediction
+        active = day >= starts
+        value = np.where (observed[:, day], values[:, day], prediction)
+        newLevel = alpha * (value - s) + (1 - alpha) * (level + trend)
+        trend = np.where (active, beta * (newLevel - level) + (1 - beta) * trend, trend)
+        season[:, day % WEEK_PERIOD] = np.where (active, gamma * (value - newLevel) + (1 - gamma) * s, s)
+        level = np.where (active, newLevel, level)
+    steps = np.arange (1, horizon + 1)
+    res[:, days:] = level[:, None] + trend[:, None] * steps + season[:, (days - 1 + steps) % WEEK_PERIOD]
+    return res
+
+# smoothing parameters of HOLT_WINTERS_GRID minimizing the squared one-step-ahead errors of each track (after its first week)
+# returns the alpha, beta and gamma arrays (a value per track)
+def fitHoltWinters (values):
+    values = np.asarray (values, dtype=float)
+    observed = ~np.isnan (values)
+    starts = np.where (observed.any (axis=1), observed.argmax (axis=1), values.shape[1])
+    scored = observed & (np.arange (values.shape[1]) >= starts[:, None] + WEEK_PERIOD)
+    best = None
+    for alpha, beta, gamma in itertools.product (HOLT_WINTERS_GRID['alpha'], HOLT_WINTERS_GRID['beta'], HOLT_WINTERS_GRID['gamma']):
+        predictions = holtWintersPredict (values, 0, alpha, beta, gamma)
+        errors = np.where (scored, values - predictions, 0)
+        sse = (errors ** 2).sum (axis=1)
+        if best is None:
+            best = [sse, np.full (len (values), alpha), np.full (len (values), beta), np.full (len (values), gamma)]
+        else:
+            better = sse < best[0]
+            best = [np.where (better, sse, best[0]), np.where (better, alpha, best[1]), np.where (better, beta, best[2]), np.where (better, gamma, best[3])]
+    return best[1], best[2], best[3]
+
+# predictions of the exponential smoothing engine (HOLT_WINTERS_ENGINE or SEASONAL_NAIVE_ENGINE) for all the tracks of values at once, see holtWintersPredict
+def smoothingPredict (engine, values, horizon):
+    if engine == SEASONAL_NAIVE_ENGINE:
+        return holtWintersPredict (values, horizon, **SEASONAL_NAIVE_PARAMS)
+    return holtWintersPredict (values, horizon, *fitHoltWinters (values))
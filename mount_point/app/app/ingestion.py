@@ -0,0 +1,190 @@
+from django.db import transaction
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import app.models
+import app.qualityJobs
+
+# number of hourly counts kept in memory before they are written to the database
+IMPORT_BATCH_ROWS = 20000
+
+# failure of the write of a batch, which concerns all its buffered counts and not only the ones being added when it occurred
+class BatchWriteError (Exception):
+    pass
+
+# incremental importer of hourly counts, shared by the data upload views
+# counts are buffered per (sensor, modality, direction) and written in bulk each time IMPORT_BATCH_ROWS are accumulated,
+# thus the memory usage doesn't depend on the size of the uploaded dataset
+# each batch is written in one transaction with the quality jobs of its tracks, so an import failing partway leaves no counts without recomputation;
+# close () has to be called in any case (typically in a finally clause) to update the sensors of the imported tracks
+class CountsImporter:
+    def __init__ (self, batchRows = IMPORT_BATCH_ROWS):
+        self.batchRows = batchRows
+        self.sensors = {}
+        self.tracks = {}
+        self.buffers = {}
+        self.buffered = 0
+        self.fingerprints = {}
+        self.inserted = 0
+        self.updated = 0
+        self.skippedBlocks = 0
+
+    # creates or updates the sensor information (type/location/meta); location and meta are expected as the JSON strings stored in the Sensor model
+    def addSensor (self, ref, sensorTypeName, location, meta):
+        self.sensors[ref] = upsertSensor (ref, sensorTypeName, location, meta)
+
+    # counts of a sensor not added in this import are only accepted if the sensor already exists
+    def getSensor (self, ref):
+        if ref not in self.sensors:
+            cS = app.models.Sensor.objects.filter (ref=ref).first()
+            if not cS:
+                raise ValueError ('Unknown sensor ' + ref)
+            self.sensors[ref] = cS
+        return self.sensors[ref]
+
+    # hour and count can be strings (CSV upload), they are converted here so that an incorrect row fails on its own and not in the batch write
+    def addCount (self, ref, modality, isReverse, date, hour, count):
+        self.addCounts (ref, modality, isReverse, [(date, int (hour), float (count))])
+
+    # counts is a list of (date, hour, count) tuples; fingerprint is the one of the counts if they are a pushed block (see addCountsBlock)
+    def addCounts (self, ref, modality, isReverse, counts, fingerprint = None):
+        self.getSensor (ref)
+        key = (ref, modality, isReverse)
+        if key not in self.buffers:
+            self.buffers[key] = []
+        self.buffers[key] += counts
+        self.buffered += len (counts)
+        self.fingerprints[key] = fingerprint
+        if self.buffered >= self.batchRows:
+            self.flush ()
+
+    # adds a pushed block of counts, which is skipped if it is identical to the last block ingested for the track (see SensorTrack.ingestCountsBlock)
+    def addCountsBlock (self, ref, modality, isReverse, counts):
+        self.getSensor (ref)
+        if len (counts) == 0:
+            return
+        key = (ref, modality, isReverse)
+        fingerprint = app.models.getCountsFingerprint (counts)
+        lastFingerprint = self.fingerprints[key] if key in self.fingerprints else self.getTrack (key).countsFingerprint
+        if fingerprint == lastFingerprint:
+            self.skippedBlocks += 1
+            return
+        self.addCounts (ref, modality, isReverse, counts, fingerprint)
+
+    # writes all the buffered counts, one bulk upsert per (sensor, modality, direction), and queues the quality checks of their tracks
+    # the fingerprint of the last pushed block of a track is stored in the same transaction, so a block is never skipped unless its counts were committed and queued
+    # if the write fails, the batch is dropped (with the tracks created and the fingerprints of the blocks in it, which were rolled back) and BatchWriteError is raised
+    def flush (self):
+        trackRanges = []
+        inserted, updated = 0, 0
+        knownTracks = set (self.tracks)
+        try:
+            with transaction.atomic ():
+                for key, counts in self.buffers.items ():
+                    if len (counts) == 0:
+                        continue
+                    dates = [c[0] for c in counts]
+                    trackRanges.append ((self.getTrack (key), min (dates), max (dates)))
+                    trackInserted, trackUpdated = self.getTrack (key).upsertHourlyCounts (counts)
+                    inserted += trackInserted
+                    updated += trackUpdated
+                    if self.fingerprints[key]:
+                        self.getTrack (key).setCountsFingerprint (self.fingerprints[key])
+                app.qualityJobs.markTracksDirty (trackRanges)
+        except Exception as e:
+            for key in self.buffers:
+                self.fingerprints.pop (key, None)
+                if key not in knownTracks:
+                    self.tracks.pop (key, None)
+            self.buffers = {}
+            self.buffered = 0
+            raise BatchWriteError (repr (e)) from e
+        self.inserted += inserted
+        self.updated += updated
+        self.buffers = {}
+        self.buffered = 0
+
+    def getTrack (self, key):
+        if key not in self.tracks:
+            ref, modality, isReverse = key
+            self.tracks[key] = getOrCreateTrack (self.sensors[ref], modality, isReverse)
+        return self.tracks[key]
+
+    # writes the remaining counts; returns the numbers of inserted and updated hourly counts
+    def finish (self):
+        self.flush ()
+        return self.inserted, self.updated
+
+    # updates the modalities / directions of the sensors from their tracks, including the tracks created by the batches written before a failure
+    def close (self):
+        for cS in self.sensors.values ():
+            refreshSensorTracksInfo (cS)
+
+# columnar (Parquet / Arrow IPC) import, with the same columns as the CSV upload:
+# sensor_type,sensor_ref,modality,is_reverse_channel,date,hour,count,location,meta
+# the file is read by record batches of IMPORT_BATCH_ROWS rows, each batch is parsed and grouped per track in a vectorized way
+def importColumnarFile (importer, source, fileFormat):
+    for batch in iterColumnarBatches (source, fileFormat):
+        df = batch.to_pandas ()
+        df['date'] = pd.to_datetime (df['date']).dt.date
+        newSensors = df[~df['sensor_ref'].isin (list (importer.sensors))].drop_duplicates ('sensor_ref')
+        for ref, sensorType, location, meta in zip (newSensors['sensor_ref'], newSensors['sensor_type'], newSensors['location'], newSensors['meta']):
+            importer.addSensor (ref, sensorType, location, meta)
+        for (ref, modality, isReverse), group in df.groupby (['sensor_ref', 'modality', 'is_reverse_channel'], sort=False):
+            isReverse = isReverse if isinstance (isReverse, str) else bool (isReverse)
+            importer.addCounts (ref, modality, isReverse, list (zip (group['date'], group['hour'].to_numpy (dtype=int).tolist (), group['count'].to_numpy (dtype=float).tolist ())))
+
+# fileFormat is either 'parquet' or 'arrow' (Arrow IPC, file or stream format)
+def iterColumnarBatches (source, fileFormat):
+    if fileFormat == 'parquet':
+        yield from pq.ParquetFile (source).iter_batches (batch_size=IMPORT_BATCH_ROWS)
+        return
+    try:
+        reader = pa.ipc.open_file (source)
+    except pa.ArrowInvalid:
+        source.seek (0)
+        yield from pa.ipc.open_stream (source)
+        return
+    for i in range (reader.num_record_batches):
+        yield reader.get_batch (i)
+
+# guesses the columnar format from the file name
+def getColumnarFormat (fileName):
+    if fileName.lower ().endswith ('.parquet'):
+        return 'parquet'
+    if fileName.lower ().endswith (('.arrow', '.feather', '.ipc', '.arrows')):
+        return 'arrow'
+    return None
+
+# creates the sensor with the given ref or updates its type / location / meta if it already exists
+def upsertSensor (ref, sensorTypeName, location, meta):
+    cType = app.models.sensorTypeRegistry.getOrCreate (sensorTypeName)
+    cS = app.models.Sensor.objects.filter (ref=ref).first()
+    if cS:
+        cS.location = location
+        cS.sensorType = cType
+        cS.meta = meta
+        cS.save ()
+    else:
+        cS = app.models.Sensor.objects.create (ref=ref, location=location, hasReverse=False, meta=meta, sensorType=cType)
+    return cS
+
+def getOrCreateTrack (cS, modality, isReverse):
+    mod = app.models.modalityRegistry.getOrCreate (modality)
+    cTrack = cS.tracks.filter (isReverseChannel=isReverse).filter (modality=mod).first ()
+    if not cTrack:
+        cTrack = app.models.SensorTrack.objects.create (sensor=cS, isReverseChannel=isReverse, modality=mod)
+    return cTrack
+
+# recomputes the available modalities and the reverse channel flag of the sensor from its tracks
+def refreshSensorTracksInfo (cS):
+    modalities = set()
+    hasReverse = False
+    for cTrack in cS.tracks.all ():
+        modalities.add (cTrack.modality)
+        hasReverse = hasReverse or cTrack.isReverseChannel
+    cS.hasReverse = hasReverse
+    cS.availableModalities.set (modalities)
+    cS.save()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+import app.models
+import app.responseCache
+
+# computation of the stored card fields (parsed location and extra fields) of every sensor, e.g. for the sensors uploaded before they were introduced
+class Command (BaseCommand):
+    help = 'Recomputes the stored card fields (parsed location and extra fields) of every sensor'
+
+    def handle (self, *args, **options):
+        sensors = list (app.models.Sensor.objects.all ())
+        for cS in sensors:
+            cS.updateCardFields ()
+        app.models.Sensor.objects.bulk_update (sensors, ['cardFields'], batch_size = app.models.BULK_BATCH_SIZE)
+        #bulk_update doesn't send the post_save signals invalidating the cached sensors collection
+        app.responseCache.bumpDataVersion (app.responseCache.SENSORS_COLLECTION)
+        self.stdout.write ('Updated the cards of ' + str (len (sensors)) + ' sensors')
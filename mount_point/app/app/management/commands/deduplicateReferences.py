@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min, F, Exists, OuterRef
+from django.db.models.functions import Lower
+
+import app.models
+import app.qualityJobs
+
+# merging of the Modality / SensorType / QualityValidationTest rows sharing the same name (regardless of the case for the latter), which is needed before the unique constraints on their names can be created
+# the rows referencing a duplicate are moved to the oldest row of the name (the one returned by the lookups so far), then the duplicates are deleted
+# this can give several tracks of the same sensor, direction and modality, and several quality results of a track for the same date and test, which are merged as well
+class Command (BaseCommand):
+    help = 'Merges the modalities, sensor types and quality validation tests having the same name into their oldest row, and the sensor tracks and quality results duplicated by it'
+
+    def handle (self, *args, **options):
+        with transaction.atomic ():
+            for model, references in [
+                (app.models.Modality, [(app.models.SensorTrack, 'modality')]),
+                (app.models.SensorType, [(app.models.Sensor, 'sensorType')]),
+                (app.models.QualityValidationTest, [(app.models.QualityValidationResult, 'test')]),
+            ]:
+                merged = 0
+                caseInsensitive = app.models.referenceRegistries[model].caseInsensitive
+                for name in model.objects.values (key=Lower ('name') if caseInsensitive else F ('name')).annotate (n=Count ('id')).filter (n__gt=1).values_list ('key', flat=True):
+                    kept, *duplicates = model.objects.filter (**{('name__iexact' if caseInsensitive else 'name'): name}).order_by ('id')
+                    for referencingModel, field in references:
+                        referencingModel.objects.filter (**{field + '__in': duplicates}).update (**{field: kept})
+                    if model is app.models.Modality:
+                        for cS in app.models.Sensor.objects.filter (availableModalities__in = duplicates).distinct ():
+                            cS.availableModalities.add (kept)
+                            cS.availableModalities.remove (*duplicates)
+                    for duplicate in duplicates:
+                        duplicate.delete ()
+                    merged += len (duplicates)
+                self.stdout.write (model.__name__ + ': ' + str (merged) + ' duplicated rows merged')
+            self.stdout.write ('SensorTrack: ' + str (mergeTracks ()) + ' duplicated tracks merged')
+            self.stdout.write ('QualityValidationResult: ' + str (deleteDuplicatedResults ()) + ' duplicated results deleted')
+
+# the hourly counts of the tracks of the same sensor, direction and modality are moved to the oldest of them (its counts winning for the hours present in both),
+# the other tracks are deleted with their daily totals and quality results, and the whole history of the kept track is queued for the quality checks
+def mergeTracks ():
+    merged = 0
+    for group in app.models.SensorTrack.objects.values ('sensor', 'isReverseChannel', 'modality').annotate (n=Count ('id')).filter (n__gt=1):
+        kept, *duplicates = app.models.SensorTrack.objects.filter (sensor=group['sensor'], isReverseChannel=group['isReverseChannel'], modality=group['modality']).order_by ('id')
+        for duplicate in duplicates:
+            duplicate.hMeasurements.filter (Exists (app.models.HMeasurement.objects.filter (sensor=kept, date=OuterRef ('date'), hour=OuterRef ('hour')))).delete ()
+            duplicate.hMeasurements.update (sensor=kept)
+            duplicate.delete ()
+        app.models.SensorTrack.objects.filter (id=kept.id).update (countsFingerprint=None, dataVersion=F ('dataVersion') + 1)
+        app.qualityJobs.markTracksDirty ([(kept, None, None)])
+        merged += len (duplicates)
+    return merged
+
+# keeps the oldest quality result of each track, date and test
+def deleteDuplicatedResults ():
+    deleted = 0
+    for group in app.models.QualityValidationResult.objects.values ('sensor', 'date', 'test').annotate (n=Count ('id'), first=Min ('id')).filter (n__gt=1):
+        deleted += app.models.QualityValidationResult.objects.filter (sensor=group['sensor'], date=group['date'], test=group['test']).exclude (id=group['first']).delete ()[0]
+    return deleted
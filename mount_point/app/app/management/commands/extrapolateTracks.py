@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+import csv
+import sys
+import numpy as np
+from datetime import timedelta
+
+import app.models
+import app.forecasting
+from app.trackSeries import TrackSeries, toDays
+
+# batch extrapolation of the daily totals of every sensor track (or of the tracks of the given sensors), written as CSV
+# the exponential smoothing engines predict all the tracks at once; with --evaluate, the last days of the history are held out instead
+# and the error of each engine on them is reported, to compare their accuracy with SARIMAX on the actual data
+class Command (BaseCommand):
+    help = 'Predicts the daily totals of the next days for every sensor track, or compares the accuracy of the extrapolation engines'
+
+    def add_arguments (self, parser):
+        parser.add_argument ('--engine', choices=app.forecasting.EXTRAPOLATION_ENGINES, default=app.forecasting.HOLT_WINTERS_ENGINE)
+        parser.add_argument ('--days', type=int, default=14, help='Number of days to predict')
+        parser.add_argument ('--training-days', type=int, default=182, help='Number of days of history used to fit the models')
+        parser.add_argument ('--until', help='Last day of history used (YYYY-MM-DD), the last day with daily totals by default')
+        parser.add_argument ('--sensors', nargs='+', help='References of the sensors to predict (all by default)')
+        parser.add_argument ('--output', help='CSV file to write (standard output by default)')
+        parser.add_argument ('--evaluate', action='store_true', help='Hold out the last --days days and report the error of every engine')
+
+    def handle (self, *args, **options):
+        tracks = app.models.SensorTrack.objects.select_related ('sensor', 'modality').order_by ('id')
+        if options['sensors']:
+            tracks = tracks.filter (sensor__ref__in = options['sensors'])
+        tracks = list (tracks)
+        until = toDays ([options['until']])[0].item () if options['until'] else app.models.DMeasurement.objects.filter (sensor__in = tracks).aggregate (Max ('date'))['date__max']
+        if len (tracks) == 0 or until is None:
+            raise CommandError ('No daily totals to extrapolate')
+        series = loadDailySeries (tracks, until - timedelta (days = options['training_days'] - 1), until)
+        if options['evaluate']:
+            self.evaluate (tracks, series, options['days'])
+            return
+        days, predictions = predict (options['engine'], series, until, options['days'])
+        timedOut = [i for i, s in enumerate (series) if (len (s) > 0) and np.isnan (predictions[i]).any ()]
+        output = open (options['output'], 'w', newline='') if options['output'] else sys.stdout
+        writer = csv.writer (output)
+        writer.writerow (['sensor_ref', 'modality', 'is_reverse_channel', 'date', 'prediction'])
+        dateStrings = np.datetime_as_string (days, unit='D').tolist ()
+        for cT, trackSeries, prediction in zip (tracks, series, predictions):
+            if (len (trackSeries) == 0) or np.isnan (prediction).any ():
+                continue
+            for date, value in zip (dateStrings, prediction.tolist ()):
+                writer.writerow ([cT.sensor.ref, cT.modality.name, cT.isReverseChannel, date, value])
+        if options['output']:
+            output.close ()
+            self.stdout.write ('Predicted ' + str (sum (1 for s in series if len (s) > 0) - len (timedOut)) + ' sensor tracks')
+        self.reportTimedOut (options['engine'], [tracks[i] for i in timedOut])
+
+    # the SARIMAX fits not done within app.forecasting.FIT_WAIT_TIMEOUT have no prediction, they are reported on the standard error (not to mix them with the CSV)
+    def reportTimedOut (self, engine, timedOutTracks):
+        if len (timedOutTracks) > 0:
+            self.stderr.write (engine + ': the fits of ' + str (len (timedOutTracks)) + ' sensor tracks timed out (' + ', '.join (str (cT).strip () for cT in timedOutTracks) + ')')
+
+    # mean absolute error and mean absolute percentage error of each engine on the held out days (of the tracks having at least 2 weeks of history before them)
+    # all the engines are scored on the same tracks: the ones predicted by every engine, the tracks whose fit timed out being reported
+    def evaluate (self, tracks, series, heldOutDays):
+        until = max (s.days[-1] for s in series if len (s) > 0)
+        trainingEnd = until - np.timedelta64 (heldOutDays, 'D')
+        training = [s.select (s.days <= trainingEnd) for s in series]
+        evaluated = [i for i, s in enumerate (training) if len (s) >= 14]
+        if len (evaluated) == 0:
+            raise CommandError ('Not enough history to evaluate the engines')
+        actual = np.full ((len (evaluated), heldOutDays), np.nan)
+        for row, i in enumerate (evaluated):
+            heldOut = series[i].select (series[i].days > trainingEnd)
+            actual[row, (heldOut.days - trainingEnd).astype (int) - 1] = heldOut.values
+        predictions = {engine: predict (engine, [training[i] for i in evaluated], trainingEnd.item (), heldOutDays)[1] for engine in app.forecasting.EXTRAPOLATION_ENGINES}
+        predicted = np.ones (len (evaluated), dtype=bool)
+        for engine in app.forecasting.EXTRAPOLATION_ENGINES:
+            timedOut = np.isnan (predictions[engine]).any (axis=1)
+            self.reportTimedOut (engine, [tracks[evaluated[row]] for row in np.flatnonzero (timedOut)])
+            predicted &= ~timedOut
+        if not predicted.any ():
+            raise CommandError ('No sensor track predicted by every engine')
+        for engine in app.forecasting.EXTRAPOLATION_ENGINES:
+            errors = np.abs (predictions[engine][predicted] - actual[predicted])
+            with np.errstate (divide='ignore', invalid='ignore'):
+                percentages = np.where (actual[predicted] > 0, errors / actual[predicted], np.nan)
+            self.stdout.write (engine + ': MAE ' + str (round (float (np.nanmean (errors)), 2)) + ', MAPE ' + str (round (100 * float (np.nanmean (percentages)), 1)) + '% on ' + str (int (predicted.sum ())) + ' sensor tracks')
+
+# TrackSeries of the daily totals of the tracks between dateFrom and dateTo, loaded in a single query
+def loadDailySeries (tracks, dateFrom, dateTo):
+    rows = {cT.id: [] for cT in tracks}
+    for trackId, date, countSum in app.models.DMeasurement.objects.filter (sensor__in = tracks).filter (date__gte = dateFrom).filter (date__lte = dateTo).order_by ('sensor_id', 'date').values_list ('sensor_id', 'date', 'count_sum'):
+        rows[trackId].append ((date, countSum))
+    return [TrackSeries (toDays ([r[0] for r in rows[cT.id]]), np.array ([r[1] for r in rows[cT.id]], dtype=float)) for cT in tracks]
+
+# predictions of the horizon days after until (a date) for each of the series, as (days, series x days array), NaN for the series without prediction
+def predict (engine, series, until, horizon):
+    days = np.datetime64 (until, 'D') + np.arange (1, horizon + 1)
+    predictions = np.full ((len (series), horizon), np.nan)
+    available = [i for i, s in enumerate (series) if len (s) > 0]
+    if engine == app.forecasting.SARIMAX_ENGINE:
+        fits = [{'series': series[i].toPandas ().asfreq ('D'), 'spec': app.forecasting.WEEKLY_SARIMAX, 'start': str (days[0]), 'end': str (days[-1])} for i in available]
+        for i, prediction in zip (available, app.forecasting.fitAndPredictAll (fits)):
+            if prediction is not None:
+                predictions[i] = prediction.to_numpy ()
+        return days, predictions
+    #aligned on the common axis, extended to until for the tracks ending earlier
+    axis, values = TrackSeries.toMatrix ([series[i] for i in available] + [TrackSeries (toDays ([until]), np.array ([np.nan]))])
+    smoothed = app.forecasting.smoothingPredict (engine, values[:-1], horizon)
+    predictions[available] = smoothed[:, len (axis):]
+    return days, predictions
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+import app.ingestion
+
+# import of Parquet / Arrow IPC files (same columns as the CSV upload) from the local disk
+class Command (BaseCommand):
+    help = 'Imports hourly counts from Parquet or Arrow IPC files having the columns of the CSV upload'
+
+    def add_arguments (self, parser):
+        parser.add_argument ('paths', nargs='+')
+        parser.add_argument ('--format', choices=['parquet', 'arrow'], help='File format (guessed from the extension by default)')
+
+    def handle (self, *args, **options):
+        importer = app.ingestion.CountsImporter ()
+        try:
+            for path in options['paths']:
+                fileFormat = options['format'] or app.ingestion.getColumnarFormat (path)
+                if not fileFormat:
+                    raise CommandError ('Unknown file format for ' + path)
+                with open (path, 'rb') as source:
+                    app.ingestion.importColumnarFile (importer, source, fileFormat)
+                self.stdout.write ('Imported ' + path)
+            inserted, updated = importer.finish ()
+        finally:
+            importer.close ()
+        self.stdout.write (str (inserted) + ' hourly counts inserted, ' + str (updated) + ' updated')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+import time
+
+import app.qualityJobs
+
+# worker recomputing the daily totals and quality checks of the tracks marked dirty by the data ingestion
+# runs forever by default (polling the queue every --sleep seconds when it is empty); use --once to only drain the current queue
+class Command (BaseCommand):
+    help = 'Recomputes the daily totals and quality checks of the sensor tracks queued by the data ingestion'
+
+    def add_arguments (self, parser):
+        parser.add_argument ('--once', action='store_true', help='Exit as soon as the queue is empty')
+        parser.add_argument ('--sleep', type=float, default=5, help='Seconds to wait before polling an empty queue again')
+
+    def handle (self, *args, **options):
+        while True:
+            close_old_connections ()
+            processed = app.qualityJobs.processPendingJobs ()
+            if processed > 0:
+                self.stdout.write ('Recomputed ' + str (processed) + ' sensor tracks')
+            if options['once']:
+                break
+            time.sleep (options['sleep'])
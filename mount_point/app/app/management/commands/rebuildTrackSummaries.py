@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+import app.models
+
+# (re-)creation of the SensorTrackSummary of every track, e.g. for the tracks uploaded before the summaries were introduced
+class Command (BaseCommand):
+    help = 'Recomputes the summary (available dates span, number of days passing all the quality tests) of every sensor track'
+
+    def handle (self, *args, **options):
+        cnt = 0
+        for cTrack in app.models.SensorTrack.objects.all ().iterator ():
+            cTrack.updateSummary ()
+            cnt += 1
+        self.stdout.write ('Updated the summaries of ' + str (cnt) + ' sensor tracks')
@@ -1,21 +1,39 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, Min, Max, F
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 
 import json
 import hashlib 
 import traceback
+import time
+import threading
 from collections import defaultdict
 import pandas as pd
 from sklearn.cluster import DBSCAN
 import numpy as np
 from datetime import timedelta
 
+import app.responseCache
+
+# number of rows sent in a single INSERT statement by the bulk writes (ingestion upserts, daily totals and quality results)
+BULK_BATCH_SIZE = 5000
+
+# the reference tables cached by ReferenceRegistry are reloaded after this number of seconds, to catch up with the modifications made by other processes
+REFERENCE_CACHE_TTL = 300
+
+QUALITY_TESTS = ['AllTests', 'PerformanceThreshold', 'MinThreshold', 'DBSCAN']
+# the PerformanceThreshold test is only relevant for tracks having more than 15 days between the first and the last measurement
+PERFORMANCE_THRESHOLD_MIN_SPAN = timedelta (days=16)
+# the widest rolling window of the quality checks is 30 days centered on the date, this margin covers its half (with a day of safety)
+ROLLING_WINDOW_MARGIN = timedelta (days=16)
+
 class Modality (models.Model):
-    name = models.CharField (max_length = 10, db_index = True)
+    name = models.CharField (max_length = 10, unique = True)
 
     def __str__(self):
         return self.name
@@ -23,7 +41,7 @@ class Modality (models.Model):
         verbose_name_plural = "Modalities"
 
 class SensorType (models.Model):
-    name = models.CharField (max_length = 30, db_index = True)
+    name = models.CharField (max_length = 30, unique = True)
 
     def __str__(self):
         return self.name
@@ -37,18 +55,36 @@ class Sensor (models.Model):
     hasReverse = models.BooleanField ()
     meta = models.TextField (blank=True, null=True)
     sensorType = models.ForeignKey ('SensorType', db_index = True, related_name = 'sensors', on_delete = models.CASCADE)
+    #parsed location (GeoJSON feature) and extra fields of the card, derived from location and meta at save time (see updateCardFields)
+    cardFields = models.JSONField (blank=True, null=True)
 
     def addressString (self):
-        try:
-            meta = json.loads (self.meta)
-            if 'addressString' in meta:
-                return meta['addressString']
-        except:
-            pass
-        return ''
+        extraFields = self.getCardFields ()['extraFields']
+        return extraFields['addressString'] if 'addressString' in extraFields else ''
 
     # returns the dictionary representation of relevant information to use in the API requests
-    def card (self):
+    # modalityNames can be given when they are already fetched together with the sensor
+    def card (self, modalityNames=None):
+        cardFields = self.getCardFields ()
+        return {
+            "ref": self.ref,
+            "location": cardFields['location'],
+            "modalities": sorted(modalityNames if modalityNames is not None else [mod.name for mod in self.availableModalities.all()]),
+            "hasReverse": self.hasReverse,
+            "sensorType": self.sensorType.card(),
+            "extraFields": cardFields['extraFields']
+        }
+
+    # the stored card fields, computed on the fly for the sensors saved before they were introduced (see the buildSensorCards command)
+    def getCardFields (self):
+        if self.cardFields is None:
+            self.updateCardFields ()
+        return self.cardFields
+
+    def updateCardFields (self):
+        self.cardFields = {'location': self.getLocationDic (), 'extraFields': self.getExtraFields ()}
+
+    def getExtraFields (self):
         extraFields = {}
         try:
             meta = json.loads (self.meta)
@@ -57,14 +93,7 @@ class Sensor (models.Model):
                     extraFields[k] = meta[k]
         except:
             print (traceback.format_exc())
-        return {
-            "ref": self.ref,
-            "location": self.getLocationDic (),
-            "modalities": sorted([mod.name for mod in self.availableModalities.all()]),
-            "hasReverse": self.hasReverse,
-            "sensorType": self.sensorType.card(),
-            "extraFields": extraFields
-        }
+        return extraFields
     # reformat of the location information depending on type
     def getLocationDic (self):
         try:
@@ -96,6 +125,10 @@ class SensorTrack (models.Model):
     sensor = models.ForeignKey ('Sensor', db_index = True, related_name = 'tracks', on_delete = models.CASCADE)
     isReverseChannel = models.BooleanField (db_index = True, default = False)
     modality = models.ForeignKey ('Modality', db_index = True, related_name = 'sensorTracks', on_delete = models.CASCADE)
+    #fingerprint of the last block of counts pushed for the track, reset by any other write of its hourly counts
+    countsFingerprint = models.CharField (max_length = 64, blank=True, null=True)
+    #incremented on every change of the hourly counts or of the daily totals / quality results, used as a key of the analysis results cache
+    dataVersion = models.IntegerField (default = 0)
 
     def __str__(self):
         return self.sensor.ref + ' ' + self.modality.name + ' ' + ('rev' if self.isReverseChannel else '')
@@ -110,51 +143,199 @@ class SensorTrack (models.Model):
         else:
             return None
 
-    def exploreDataConsistency (self):
-        allCounts = [val for val in self.hMeasurements.values ('date', 'hour', 'count')]
-        adf = pd.DataFrame.from_records (allCounts)
-        #(re-) parsing the date field in case it is not yet in datetime format
-        adf['date'] = pd.to_datetime(adf['date'])
-        #creating a new dataframe with per day aggregation and renaming the columns for a flat index
-        adfd = adf.groupby(['date'], as_index=False).agg({'count':['count','sum']})
-        adfd.columns = ["_".join(col_name).rstrip('_') for col_name in adfd.columns]
-        adfd = adfd.rename (columns={'count_count':'count'})
-        #we will exploit the date as an index
-        adfd.set_index ('date', inplace=True)
-        #checking global min threshold - the signal is seen in at least 3 separate hours...
-        adfd['MinThresholdPassed'] = adfd['count'] > 2
-        #performing the DBSCAN clustering and finding the outliers
-        if len(adfd) > 0:
-            clustering = DBSCAN(eps=0.5, min_samples=4).fit_predict(np.array (adfd['count']).reshape (-1,1))
-            adfd['DBSCANPassed'] = clustering != -1
-        else:
-            adfd['DBSCANPassed'] = False
-        #computing the rolling averages and comparing with the fixed quantiles in the dataset (having a discount on the lower end)
-        adfd['rolling'] = adfd['count'].rolling ('5D', center=True, min_periods=1).mean ()
-        adfd['rolling3MQ50D85'] = 0.85 * adfd['count'].rolling ('30D', center=True, min_periods=10).median ()
-        adfd['rolling3MQ75'] = adfd['count'].rolling ('30D', center=True, min_periods=10).quantile (0.75)
-        adfd['residual'] = adfd['count'] - adfd['rolling']
-        adfd['PerformanceThresholdPassed'] = (adfd['rolling'] > adfd['rolling3MQ50D85']) | (adfd['count'] >= adfd['rolling3MQ75'])
-        datesSpan = self.availableDatesSpan ()
+    # bulk insert-or-update of the hourly counts of the track, relying on the (sensor, date, hour) unique constraint
+    # counts is an iterable of (date, hour, count) tuples; if a (date, hour) pair is repeated, the last value wins
+    # returns the numbers of inserted and updated rows
+    def upsertHourlyCounts (self, counts):
+        newCounts = {}
+        for cdate, hour, count in counts:
+            newCounts[(cdate, int (hour))] = float (count)
+        if len (newCounts) == 0:
+            return 0, 0
+        dates = [k[0] for k in newCounts]
+        with transaction.atomic ():
+            SensorTrack.objects.filter (id=self.id).update (countsFingerprint=None, dataVersion=F ('dataVersion') + 1)
+            self.countsFingerprint = None
+            existing = set (self.hMeasurements.filter (date__gte = min (dates)).filter (date__lte = max (dates)).values_list ('date', 'hour'))
+            updated = sum (1 for k in newCounts if k in existing)
+            HMeasurement.objects.bulk_create (
+                [HMeasurement (sensor=self, date=k[0], hour=k[1], count=v) for k, v in newCounts.items()],
+                batch_size = BULK_BATCH_SIZE,
+                update_conflicts = True,
+                unique_fields = ['sensor', 'date', 'hour'],
+                update_fields = ['count']
+            )
+        return len (newCounts) - updated, updated
+
+    # upserts a pushed block of (date, hour, count) counts, unless it is identical to the last block pushed for the track (typically an upstream retry)
+    # returns the numbers of inserted and updated rows and if the block was skipped
+    # the caller is expected to queue the quality checks of the track in the same transaction, a block being skipped only if its counts were processed
+    def ingestCountsBlock (self, counts):
+        #an empty block doesn't replace the fingerprint of the last block
+        if len (counts) == 0:
+            return 0, 0, False
+        fingerprint = getCountsFingerprint (counts)
+        if fingerprint == self.countsFingerprint:
+            return 0, 0, True
+        with transaction.atomic ():
+            inserted, updated = self.upsertHourlyCounts (counts)
+            self.setCountsFingerprint (fingerprint)
+        return inserted, updated, False
+
+    def setCountsFingerprint (self, fingerprint):
+        self.countsFingerprint = fingerprint
+        SensorTrack.objects.filter (id=self.id).update (countsFingerprint=fingerprint)
+
+    # computes the daily totals and the quality checks of the track and saves them
+    # when the range of dates touched by the ingestion is given (dateFrom/dateTo), only the days whose rolling windows overlap it are recomputed;
+    # the outcome is identical to the full recomputation, which is used for new or short (see PERFORMANCE_THRESHOLD_MIN_SPAN) tracks
+    def exploreDataConsistency (self, dateFrom=None, dateTo=None):
+        if (dateFrom is not None) and (dateTo is not None):
+            span = self.dMeasurements.aggregate (first=Min ('date'), last=Max ('date'))
+            if span['first'] and (span['last'] - span['first'] >= PERFORMANCE_THRESHOLD_MIN_SPAN):
+                self.updateDataConsistency (dateFrom, dateTo)
+                self.updateSummary ()
+                self.bumpDataVersion ()
+                return
+        adfd = getDailyQualityFrame (self.hMeasurements.values ('date', 'hour', 'count'))
+        valueToPassed = getDBSCANPassedValues (adfd['count'].value_counts ().to_dict ())
+        adfd['DBSCANPassed'] = adfd['count'].map (valueToPassed).astype (bool)
         #performanceThreshold test is not relevant when 15 days or less, so forcing the "passed" state
-        if datesSpan and (datesSpan[1] - datesSpan[0] < timedelta (days=16)):
-            adfd['PerformanceThresholdPassed'] = True        
+        if (len (adfd) > 0) and (adfd.index[-1] - adfd.index[0] < PERFORMANCE_THRESHOLD_MIN_SPAN):
+            adfd['PerformanceThresholdPassed'] = True
         #shortcut for the combination of all tests
         adfd['AllTestsPassed'] = adfd['MinThresholdPassed'] & adfd['DBSCANPassed'] & adfd['PerformanceThresholdPassed']
-        tests = ['AllTests', 'PerformanceThreshold', 'MinThreshold', 'DBSCAN']
-        #verifying that the test types are present in the DB
-        for name in tests:
-            if not QualityValidationTest.objects.filter (name__iexact = name).first():
-                QualityValidationTest.objects.create (name = name)
-        testNameToObject = {name:QualityValidationTest.objects.filter (name__iexact = name).first() for name in tests}
-        #cleaning previous results and daily totals (if any) --- in case of updates
-        self.dMeasurements.all().delete ()
-        self.qualityValidationResults.all().delete()
-        #saving the outcomes
-        for rowDate,row in adfd.iterrows ():
-            DMeasurement.objects.create (sensor=self, date=rowDate.date(), count=row['count'], count_sum=row['count_sum'])
-            for testName in tests:
-                QualityValidationResult.objects.create (sensor=self, date=rowDate.date(), test=testNameToObject[testName], passed=row[testName + 'Passed'])
+        self.saveDailyQuality (adfd)
+        self.updateSummary ()
+        self.bumpDataVersion ()
+
+    def bumpDataVersion (self):
+        SensorTrack.objects.filter (id=self.id).update (dataVersion=F ('dataVersion') + 1)
+
+    # refreshes the SensorTrackSummary of the track from its daily totals and quality results
+    def updateSummary (self):
+        span = self.dMeasurements.aggregate (first=Min ('date'), last=Max ('date'), total=Count ('id'))
+        passed = self.qualityValidationResults.filter (test=qualityValidationTestRegistry.getOrCreate ('AllTests')).filter (passed=True).count ()
+        SensorTrackSummary.objects.update_or_create (sensor=self, defaults={'firstDate': span['first'], 'lastDate': span['last'], 'totalDays': span['total'], 'allTestsPassedDays': passed})
+
+    # incremental version of exploreDataConsistency for the tracks spanning more than PERFORMANCE_THRESHOLD_MIN_SPAN:
+    # - the days in [dateFrom - ROLLING_WINDOW_MARGIN, dateTo + ROLLING_WINDOW_MARGIN] are recomputed from the hourly counts around them
+    # - the DBSCAN clustering only depends on the frequencies of the daily numbers of counts, so it is rerun on the updated frequencies
+    #   and the other days are only updated for the numbers of counts whose DBSCAN outcome changed
+    def updateDataConsistency (self, dateFrom, dateTo):
+        recomputeFrom = dateFrom - ROLLING_WINDOW_MARGIN
+        recomputeTo = dateTo + ROLLING_WINDOW_MARGIN
+        hMeasurements = self.hMeasurements.filter (date__gte = recomputeFrom - ROLLING_WINDOW_MARGIN).filter (date__lte = recomputeTo + ROLLING_WINDOW_MARGIN)
+        adfd = getDailyQualityFrame (hMeasurements.values ('date', 'hour', 'count'))
+        adfd = adfd[(adfd.index >= pd.Timestamp (recomputeFrom)) & (adfd.index <= pd.Timestamp (recomputeTo))].copy ()
+        recomputed = self.dMeasurements.filter (date__gte = recomputeFrom).filter (date__lte = recomputeTo)
+        oldFrequencies = {v['count']:v['n'] for v in self.dMeasurements.values ('count').annotate (n=Count ('id'))}
+        newFrequencies = defaultdict (int, oldFrequencies)
+        for v in recomputed.values ('count').annotate (n=Count ('id')):
+            newFrequencies[v['count']] -= v['n']
+        for value, n in adfd['count'].value_counts ().items ():
+            newFrequencies[int (value)] += n
+        newFrequencies = {k:v for k,v in newFrequencies.items () if v > 0}
+        oldValueToPassed = getDBSCANPassedValues (oldFrequencies)
+        valueToPassed = getDBSCANPassedValues (newFrequencies)
+        adfd['DBSCANPassed'] = adfd['count'].map (valueToPassed).astype (bool)
+        adfd['AllTestsPassed'] = adfd['MinThresholdPassed'] & adfd['DBSCANPassed'] & adfd['PerformanceThresholdPassed']
+        changedValues = [v for v in valueToPassed if (v in oldValueToPassed) and (valueToPassed[v] != oldValueToPassed[v])]
+        with transaction.atomic ():
+            self.saveDailyQuality (adfd, recomputeFrom, recomputeTo)
+            if len (changedValues) > 0:
+                self.updateDBSCANOutcomes (self.dMeasurements.exclude (date__gte = recomputeFrom, date__lte = recomputeTo).filter (count__in = changedValues), valueToPassed)
+
+    # sets the DBSCAN (and thus AllTests) outcome of the given daily totals according to valueToPassed (number of counts -> outcome)
+    def updateDBSCANOutcomes (self, dMeasurements, valueToPassed):
+        dateToPassed = {d['date']:valueToPassed[d['count']] for d in dMeasurements.values ('date', 'count')}
+        testNameToObject = getQualityValidationTests ()
+        dateToResults = defaultdict (dict)
+        for qvr in self.qualityValidationResults.filter (date__in = list (dateToPassed)).filter (test__in = [testNameToObject['MinThreshold'], testNameToObject['PerformanceThreshold']]).values ('date', 'test', 'passed'):
+            dateToResults[qvr['date']][qvr['test']] = qvr['passed']
+        for passed in [True, False]:
+            dates = [d for d in dateToPassed if dateToPassed[d] == passed]
+            self.qualityValidationResults.filter (test = testNameToObject['DBSCAN']).filter (date__in = dates).update (passed = passed)
+            allTestsDates = [d for d in dateToPassed if (dateToPassed[d] and all (dateToResults[d].values ())) == passed]
+            self.qualityValidationResults.filter (test = testNameToObject['AllTests']).filter (date__in = allTestsDates).update (passed = passed)
+
+    # replaces the daily totals and quality results of the track (only in [dateFrom, dateTo] if given) by the ones of the adfd DataFrame
+    # everything is written in one transaction with bulk inserts built from the columns of adfd
+    def saveDailyQuality (self, adfd, dateFrom=None, dateTo=None):
+        testNameToObject = getQualityValidationTests ()
+        dMeasurements = self.dMeasurements.all ()
+        qualityValidationResults = self.qualityValidationResults.all ()
+        if dateFrom is not None:
+            dMeasurements = dMeasurements.filter (date__gte = dateFrom).filter (date__lte = dateTo)
+            qualityValidationResults = qualityValidationResults.filter (date__gte = dateFrom).filter (date__lte = dateTo)
+        dates = adfd.index.date.tolist ()
+        counts = adfd['count'].to_numpy (dtype=np.int64).tolist ()
+        countSums = adfd['count_sum'].to_numpy (dtype=np.float64).tolist ()
+        with transaction.atomic ():
+            #cleaning previous results and daily totals (if any) --- in case of updates
+            dMeasurements.delete ()
+            qualityValidationResults.delete ()
+            #saving the outcomes
+            DMeasurement.objects.bulk_create ([DMeasurement (sensor_id=self.id, date=d, count=c, count_sum=cs) for d, c, cs in zip (dates, counts, countSums)], batch_size = BULK_BATCH_SIZE)
+            for testName in QUALITY_TESTS:
+                testId = testNameToObject[testName].id
+                passed = adfd[testName + 'Passed'].to_numpy (dtype=bool).tolist ()
+                QualityValidationResult.objects.bulk_create ([QualityValidationResult (sensor_id=self.id, date=d, test_id=testId, passed=p) for d, p in zip (dates, passed)], batch_size = BULK_BATCH_SIZE)
+
+# sha256 of the canonical form of a block of (date, hour, count) counts: sorted, with the last value kept for a repeated (date, hour)
+def getCountsFingerprint (counts):
+    canonical = {}
+    for cdate, hour, count in counts:
+        canonical[(cdate.isoformat (), int (hour))] = float (count)
+    return hashlib.sha256 (json.dumps (sorted (canonical.items ())).encode ('utf-8')).hexdigest ()
+
+# per day aggregation of the hourly counts (number of counts and their sum, indexed by date) with the quality checks depending on the neighbouring days only:
+# MinThreshold and PerformanceThreshold (the latter is only meaningful for the days having ROLLING_WINDOW_MARGIN of data around them)
+def getDailyQualityFrame (counts):
+    adf = pd.DataFrame.from_records (list (counts), columns=['date', 'hour', 'count'])
+    #(re-) parsing the date field in case it is not yet in datetime format
+    adf['date'] = pd.to_datetime(adf['date'])
+    #creating a new dataframe with per day aggregation and renaming the columns for a flat index
+    adfd = adf.groupby(['date'], as_index=False).agg({'count':['count','sum']})
+    adfd.columns = ["_".join(col_name).rstrip('_') for col_name in adfd.columns]
+    adfd = adfd.rename (columns={'count_count':'count'})
+    #we will exploit the date as an index
+    adfd.set_index ('date', inplace=True)
+    #checking global min threshold - the signal is seen in at least 3 separate hours...
+    adfd['MinThresholdPassed'] = adfd['count'] > 2
+    #computing the rolling averages and comparing with the fixed quantiles in the dataset (having a discount on the lower end)
+    adfd['rolling'] = adfd['count'].rolling ('5D', center=True, min_periods=1).mean ()
+    adfd['rolling3MQ50D85'] = 0.85 * adfd['count'].rolling ('30D', center=True, min_periods=10).median ()
+    adfd['rolling3MQ75'] = adfd['count'].rolling ('30D', center=True, min_periods=10).quantile (0.75)
+    adfd['residual'] = adfd['count'] - adfd['rolling']
+    adfd['PerformanceThresholdPassed'] = (adfd['rolling'] > adfd['rolling3MQ50D85']) | (adfd['count'] >= adfd['rolling3MQ75'])
+    return adfd
+
+# DBSCAN clustering of the daily numbers of counts, returning for each number of counts if it belongs to a cluster (i.e. is not an outlier)
+# the days having the same number of counts are equivalent for the clustering, so it is performed on the distinct values weighted by their frequencies
+# (same outcome as clustering each day separately, but the cost doesn't depend on the history length)
+def getDBSCANPassedValues (valueToFrequency):
+    values = sorted (valueToFrequency)
+    if len (values) == 0:
+        return {}
+    clustering = DBSCAN(eps=0.5, min_samples=4).fit_predict(np.array (values, dtype=float).reshape (-1,1), sample_weight=np.array ([valueToFrequency[v] for v in values]))
+    return {v:bool (c != -1) for v, c in zip (values, clustering)}
+
+# returns the QualityValidationTest objects by name, creating the missing ones
+def getQualityValidationTests ():
+    return {name:qualityValidationTestRegistry.getOrCreate (name) for name in QUALITY_TESTS}
+
+# summary of the daily totals of a track, maintained by the quality pipeline for the sensors collection endpoint
+class SensorTrackSummary (models.Model):
+    sensor = models.OneToOneField ('SensorTrack', related_name = 'summary', on_delete = models.CASCADE)
+    firstDate = models.DateField (blank=True, null=True)
+    lastDate = models.DateField (blank=True, null=True)
+    totalDays = models.IntegerField (default = 0) #number of days with measurements
+    allTestsPassedDays = models.IntegerField (default = 0) #number of days passing all the quality tests
+
+    # share of the days between the first and the last measurement passing all the quality tests
+    def quality (self):
+        return self.allTestsPassedDays / ((self.lastDate - self.firstDate).days + 1)
 
 class HMeasurement (models.Model):
     sensor = models.ForeignKey ('SensorTrack', db_index = True, related_name = 'hMeasurements', on_delete = models.CASCADE)
@@ -162,20 +343,153 @@ class HMeasurement (models.Model):
     hour = models.IntegerField (db_index = True)
     count = models.FloatField () #measurement value
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint (fields = ['sensor', 'date', 'hour'], name = 'unique_hmeasurement_sensor_date_hour')
+        ]
+
 class DMeasurement (models.Model):
     sensor = models.ForeignKey ('SensorTrack', db_index = True, related_name = 'dMeasurements', on_delete = models.CASCADE)
     date = models.DateField (db_index = True)
     count = models.IntegerField () #number of measurements
     count_sum = models.FloatField () #cumulative count
 
+# queue of the sensor tracks waiting for the recomputation of their daily totals and quality checks (see app.qualityJobs)
+# there is at most one job per track: marking an already queued track refreshes requestedAt and widens the dates range, which coalesces repeated ingestions
+# empty dateFrom/dateTo mean the whole track history has to be recomputed
+class QualityRecomputationJob (models.Model):
+    sensor = models.OneToOneField ('SensorTrack', related_name = 'qualityRecomputationJob', on_delete = models.CASCADE)
+    requestedAt = models.DateTimeField (db_index = True)
+    startedAt = models.DateTimeField (blank=True, null=True)
+    dateFrom = models.DateField (blank=True, null=True)
+    dateTo = models.DateField (blank=True, null=True)
+
 class QualityValidationTest (models.Model):
-    name = models.CharField (max_length = 30, db_index = True)
+    name = models.CharField (max_length = 30)
 
     def __str__(self):
         return self.name
 
+    class Meta:
+        #the tests are looked up regardless of the case of their names (see qualityValidationTestRegistry)
+        constraints = [
+            models.UniqueConstraint (Lower ('name'), name = 'unique_qualityvalidationtest_name_ci')
+        ]
+
 class QualityValidationResult (models.Model):
     sensor = models.ForeignKey ('SensorTrack', db_index = True, related_name = 'qualityValidationResults', on_delete = models.CASCADE)
     date = models.DateField (db_index = True)
     test = models.ForeignKey ('QualityValidationTest', db_index = True, related_name = 'qualityValidationResults', on_delete = models.CASCADE)
     passed = models.BooleanField (db_index = True)
+
+    class Meta:
+        #used by the exclusion of the days failing a test from the analysis (see views.filterMeasurementsForTimePeriod)
+        indexes = [
+            models.Index (fields = ['sensor', 'date'], name = 'qvr_sensor_date')
+        ]
+
+# process-local registry of a small reference table (rows identified by a unique name), resolving names to rows without queries on the hot paths
+# a caseInsensitive registry expects the table to have a unique constraint on the lower case names
+# the whole table is loaded at the first access, a name missing from the cache is looked up in the DB before being considered as absent
+# the cache is dropped when a row is saved or deleted in this process (see the signals below) and reloaded every REFERENCE_CACHE_TTL seconds
+class ReferenceRegistry:
+    def __init__ (self, model, caseInsensitive = False):
+        self.model = model
+        self.caseInsensitive = caseInsensitive
+        self.lock = threading.Lock ()
+        self.byName = None
+        self.byId = None
+        self.loadedAt = 0
+
+    def key (self, name):
+        return name.lower () if self.caseInsensitive else name
+
+    def load (self):
+        with self.lock:
+            if (self.byName is None) or (time.time () - self.loadedAt > REFERENCE_CACHE_TTL):
+                objects = list (self.model.objects.all ())
+                self.byName = {self.key (o.name):o for o in objects}
+                self.byId = {o.id:o for o in objects}
+                self.loadedAt = time.time ()
+            return self.byName, self.byId
+
+    def remember (self, obj):
+        with self.lock:
+            if self.byName is not None:
+                self.byName[self.key (obj.name)] = obj
+                self.byId[obj.id] = obj
+
+    def invalidate (self):
+        with self.lock:
+            self.byName = None
+            self.byId = None
+
+    # returns the row with the given name or None
+    def get (self, name):
+        byName, byId = self.load ()
+        if self.key (name) in byName:
+            return byName[self.key (name)]
+        obj = self.lookup (name)
+        if obj:
+            self.remember (obj)
+        return obj
+
+    def lookup (self, name):
+        return self.model.objects.filter (**{('name__iexact' if self.caseInsensitive else 'name'): name}).order_by ('id').first ()
+
+    def getById (self, objId):
+        byName, byId = self.load ()
+        if objId in byId:
+            return byId[objId]
+        obj = self.model.objects.filter (id=objId).first ()
+        if obj:
+            self.remember (obj)
+        return obj
+
+    def id (self, name):
+        obj = self.get (name)
+        return obj.id if obj else None
+
+    # returns the row with the given name, creating it if needed
+    # safe under concurrency thanks to the unique constraint on the name: if another process created the row meanwhile, that row is returned
+    def getOrCreate (self, name):
+        obj = self.get (name)
+        if obj:
+            return obj
+        try:
+            with transaction.atomic ():
+                obj = self.model.objects.create (name=name)
+        except IntegrityError:
+            obj = self.lookup (name)
+        self.remember (obj)
+        return obj
+
+modalityRegistry = ReferenceRegistry (Modality)
+sensorTypeRegistry = ReferenceRegistry (SensorType)
+qualityValidationTestRegistry = ReferenceRegistry (QualityValidationTest, caseInsensitive = True)
+
+referenceRegistries = {
+    Modality: modalityRegistry,
+    SensorType: sensorTypeRegistry,
+    QualityValidationTest: qualityValidationTestRegistry,
+}
+
+@receiver ([post_save, post_delete], sender = Modality)
+@receiver ([post_save, post_delete], sender = SensorType)
+@receiver ([post_save, post_delete], sender = QualityValidationTest)
+def invalidateReferenceRegistry (sender, **kwargs):
+    referenceRegistries[sender].invalidate ()
+
+# the card fields are derived from location and meta, thus they are refreshed on every save of the sensor
+@receiver (pre_save, sender = Sensor)
+def updateSensorCardFields (sender, instance, **kwargs):
+    instance.updateCardFields ()
+
+# the sensors collection (see views.getSensorsCollection) changes with the sensors, their summaries and the referenced names
+# the cached collection version is bumped once the transaction is committed: bumping it earlier would let a concurrent request cache the not yet committed state under the new version
+@receiver ([post_save, post_delete], sender = Sensor)
+@receiver ([post_save, post_delete], sender = SensorTrackSummary)
+@receiver ([post_save, post_delete], sender = Modality)
+@receiver ([post_save, post_delete], sender = SensorType)
+def invalidateSensorsCollection (sender, **kwargs):
+    transaction.on_commit (lambda: app.responseCache.bumpDataVersion (app.responseCache.SENSORS_COLLECTION))
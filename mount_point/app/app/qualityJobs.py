@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+import traceback
+from datetime import timedelta
+
+import app.models
+
+# a job claimed by a worker for longer than this is considered abandoned (crashed worker) and can be claimed again
+STALE_JOB_TIMEOUT = timedelta (hours=2)
+
+# deferred recomputation of the daily totals and quality checks
+# the ingestion only marks the touched tracks as dirty (a single statement, whatever the history length),
+# while the processQualityJobs management command recomputes each dirty track once, however many times it was marked
+
+# trackRanges is an iterable of (sensorTrack, dateFrom, dateTo) with the range of dates touched by the ingestion (None dates for the whole history)
+def markTracksDirty (trackRanges):
+    ranges = {}
+    for cTrack, dateFrom, dateTo in trackRanges:
+        ranges[cTrack.id] = mergeDateRanges (ranges[cTrack.id], (dateFrom, dateTo)) if cTrack.id in ranges else (dateFrom, dateTo)
+    if len (ranges) == 0:
+        return
+    now = timezone.now ()
+    with transaction.atomic ():
+        #creating the missing jobs, then widening the dates range of all of them under a row lock (to not lose a concurrent mark)
+        app.models.QualityRecomputationJob.objects.bulk_create ([app.models.QualityRecomputationJob (sensor_id=trackId, requestedAt=now, dateFrom=r[0], dateTo=r[1]) for trackId, r in ranges.items ()], ignore_conflicts=True)
+        jobs = list (app.models.QualityRecomputationJob.objects.select_for_update ().filter (sensor_id__in=list (ranges)).order_by ('id'))
+        for job in jobs:
+            job.dateFrom, job.dateTo = mergeDateRanges ((job.dateFrom, job.dateTo), ranges[job.sensor_id])
+            job.requestedAt = now
+        app.models.QualityRecomputationJob.objects.bulk_update (jobs, ['requestedAt', 'dateFrom', 'dateTo'])
+
+# union of 2 (dateFrom, dateTo) ranges, a None bound standing for the whole history
+def mergeDateRanges (r1, r2):
+    if None in r1 or None in r2:
+        return (None, None)
+    return (min (r1[0], r2[0]), max (r1[1], r2[1]))
+
+# claims the oldest pending job; the row lock is only held for the claim itself, so the ingestion is never blocked by a running recomputation
+def claimNextJob ():
+    now = timezone.now ()
+    with transaction.atomic ():
+        job = app.models.QualityRecomputationJob.objects.select_for_update (skip_locked=True).filter (Q (startedAt__isnull=True) | Q (startedAt__lt=now - STALE_JOB_TIMEOUT)).order_by ('requestedAt').first ()
+        if not job:
+            return None
+        job.startedAt = now
+        job.save (update_fields=['startedAt'])
+    return job
+
+# recomputes the track of the next pending job; returns False when the queue is empty
+# the job is only removed if the track wasn't marked dirty again during the recomputation, otherwise it is released to be processed once more
+# a failed job stays claimed and is retried after STALE_JOB_TIMEOUT
+def processNextJob ():
+    job = claimNextJob ()
+    if not job:
+        return False
+    try:
+        job.sensor.exploreDataConsistency (job.dateFrom, job.dateTo)
+    except:
+        print (traceback.format_exc())
+        return True
+    deleted, _ = app.models.QualityRecomputationJob.objects.filter (id=job.id).filter (requestedAt=job.requestedAt).delete ()
+    if not deleted:
+        app.models.QualityRecomputationJob.objects.filter (id=job.id).update (startedAt=None)
+    return True
+
+# processes the pending jobs until the queue is empty (or maxJobs are done); returns the number of processed jobs
+def processPendingJobs (maxJobs=None):
+    processed = 0
+    while (maxJobs is None) or (processed < maxJobs):
+        if not processNextJob ():
+            break
+        processed += 1
+    return processed
@@ -0,0 +1,75 @@
+from django.core.cache import cache
+
+import uuid
+import threading
+from collections import OrderedDict
+
+# serialized API responses are kept for this number of seconds at most (entries of outdated data versions are never read again and just expire)
+RESPONSE_CACHE_TIMEOUT = 24 * 3600
+
+# cache name of the getSensorsCollection response
+SENSORS_COLLECTION = 'sensorsCollection'
+
+# total size (in characters of serialized JSON) of the analysis results kept by each process
+ANALYSIS_CACHE_MAX_SIZE = 200 * 1024 * 1024
+
+# versioned cache of serialized API responses
+# it relies on the Django cache configured in the settings (database backed), thus it is shared by all the web server processes and the quality worker
+# a response is stored under the current data version of its cache name; a change of the data only has to bump the version for all the processes to stop using the previous response
+# the version is a random token, also usable as the ETag of the response
+
+def getDataVersion (name):
+    key = name + ':version'
+    version = cache.get (key)
+    if version is None:
+        #add keeps the version possibly set meanwhile by another process
+        cache.add (key, uuid.uuid4 ().hex, timeout = None)
+        version = cache.get (key)
+    return version if version is not None else uuid.uuid4 ().hex
+
+def bumpDataVersion (name):
+    cache.set (name + ':version', uuid.uuid4 ().hex, timeout = None)
+
+# returns the response stored for the given data version, building (and storing) it with build() if needed
+def getCachedResponse (name, version, build):
+    key = name + ':' + version
+    res = cache.get (key)
+    if res is None:
+        res = build ()
+        cache.set (key, res, RESPONSE_CACHE_TIMEOUT)
+    return res
+
+def getETag (version):
+    return '"' + version + '"'
+
+# process-local cache of serialized responses (strings), evicting the least recently used ones above maxSize characters
+# the keys are expected to contain the versions of the data the responses depend on (e.g. SensorTrack.dataVersion), so that entries are never invalidated but just not read anymore
+# thread-safe, as the web server runs several threads per process
+class LRUResponseCache:
+    def __init__ (self, maxSize):
+        self.maxSize = maxSize
+        self.entries = OrderedDict ()
+        self.size = 0
+        self.lock = threading.Lock ()
+
+    def get (self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end (key)
+            return self.entries[key]
+
+    def set (self, key, value):
+        if len (value) > self.maxSize:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= len (self.entries.pop (key))
+            self.entries[key] = value
+            self.size += len (value)
+            while self.size > self.maxSize:
+                _, evicted = self.entries.popitem (last=False)
+                self.size -= len (evicted)
+
+# results of the analysis endpoint (see views.getMultiSourceTrack)
+analysisCache = LRUResponseCache (ANALYSIS_CACHE_MAX_SIZE)
@@ -81,6 +81,16 @@ DATABASES = {
     }
 }
 
+# shared by the web server processes and the quality worker (versioned API responses, see app/responseCache.py)
+# the table is created with: python3 /app/app/manage.py createcachetable
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cf_cache',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -0,0 +1,83 @@
+from django.test import TestCase, SimpleTestCase
+
+import random
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+
+import app.models
+import app.forecasting
+
+class IncrementalQualityTestCase (TestCase):
+    def setUp (self):
+        #the reference rows cached by a previous test were rolled back with it
+        for registry in app.models.referenceRegistries.values ():
+            registry.invalidate ()
+        sensorType = app.models.SensorType.objects.create (name='telraam')
+        modality = app.models.Modality.objects.create (name='Car')
+        cS = app.models.Sensor.objects.create (ref='S1', location='{"type": "point", "coords": [51.05, 3.72]}', hasReverse=False, meta='{}', sensorType=sensorType)
+        self.cTrack = app.models.SensorTrack.objects.create (sensor=cS, modality=modality)
+        #4 months of hourly counts, with missing days and hours (so that the threshold and DBSCAN tests don't all pass)
+        self.random = random.Random (1)
+        self.firstDate = date (2021, 1, 1)
+        self.cTrack.upsertHourlyCounts (self.getCounts (self.firstDate, 120, 0.1))
+        self.cTrack.exploreDataConsistency ()
+
+    # (date, hour, count) counts of the given number of days, each hour being missing with the given probability
+    # (and a few days having only a couple of hours)
+    def getCounts (self, dateFrom, days, missingRate):
+        counts = []
+        for d in range (days):
+            if self.random.random () < 0.05:
+                continue
+            hours = range (24) if self.random.random () > 0.05 else range (2)
+            counts += [(dateFrom + timedelta (days=d), h, float (self.random.randint (0, 50))) for h in hours if self.random.random () >= missingRate]
+        return counts
+
+    def getQualityRows (self):
+        dMeasurements = list (self.cTrack.dMeasurements.order_by ('date').values_list ('date', 'count', 'count_sum'))
+        qualityValidationResults = list (self.cTrack.qualityValidationResults.order_by ('date', 'test__name').values_list ('date', 'test__name', 'passed'))
+        return dMeasurements, qualityValidationResults
+
+    # re-ingesting a window in the middle of the history (with more hours per day than before, changing the DBSCAN frequencies)
+    # and recomputing it incrementally gives the same daily totals and quality results as the full recomputation
+    def testIncrementalRecomputationMatchesFullRecomputation (self):
+        dateFrom = self.firstDate + timedelta (days=50)
+        counts = self.getCounts (dateFrom, 12, 0)
+        self.cTrack.upsertHourlyCounts (counts)
+        self.cTrack.exploreDataConsistency (min (c[0] for c in counts), max (c[0] for c in counts))
+        incremental = self.getQualityRows ()
+        self.cTrack.exploreDataConsistency ()
+        full = self.getQualityRows ()
+        self.assertEqual (len (incremental[0]), len (full[0]))
+        self.assertEqual (incremental[0], full[0])
+        self.assertEqual (incremental[1], full[1])
+
+    # same with counts appended after the last day of the history
+    def testIncrementalRecomputationOfAppendedDays (self):
+        dateFrom = self.firstDate + timedelta (days=120)
+        counts = self.getCounts (dateFrom, 7, 0.1)
+        self.cTrack.upsertHourlyCounts (counts)
+        self.cTrack.exploreDataConsistency (min (c[0] for c in counts), max (c[0] for c in counts))
+        incremental = self.getQualityRows ()
+        self.cTrack.exploreDataConsistency ()
+        self.assertEqual (incremental, self.getQualityRows ())
+
+class ExtrapolationEnginesTestCase (SimpleTestCase):
+    # the exponential smoothing engines are at most slightly less accurate than SARIMAX on daily series with a weekly pattern
+    # (16 weeks of history with a slow growth and 10% of noise, 2 weeks predicted)
+    def testSmoothingEnginesAccuracy (self):
+        rng = np.random.default_rng (1)
+        tracks, days, horizon = 8, 112, 14
+        t = np.arange (days + horizon)
+        pattern = rng.uniform (0.5, 1.5, (tracks, app.forecasting.WEEK_PERIOD))
+        level = rng.uniform (50, 500, tracks)[:, None] * (1 + 0.001 * t)
+        values = level * pattern[:, t % app.forecasting.WEEK_PERIOD] * (1 + rng.normal (0, 0.1, (tracks, days + horizon)))
+        training, actual = values[:, :days], values[:, days:]
+        index = pd.date_range ('2021-01-04', periods=days, freq='D')
+        start, end = str ((index[-1] + pd.Timedelta (days=1)).date ()), str ((index[-1] + pd.Timedelta (days=horizon)).date ())
+        sarimax = np.array ([app.forecasting.fitAndPredict (pd.Series (row, index=index), app.forecasting.WEEKLY_SARIMAX, start, end).to_numpy () for row in training])
+        sarimaxError = np.mean (np.abs (sarimax - actual))
+        for engine, bound in [(app.forecasting.HOLT_WINTERS_ENGINE, 1.1), (app.forecasting.SEASONAL_NAIVE_ENGINE, 1.25)]:
+            predictions = app.forecasting.smoothingPredict (engine, training, horizon)[:, days:]
+            self.assertLessEqual (np.mean (np.abs (predictions - actual)), bound * sarimaxError, engine)
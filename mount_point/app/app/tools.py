@@ -1,5 +1,8 @@
 from django.http import HttpResponse
+import io
 import json
+import gzip
+import zstandard
 
 # tiny helpers
 
@@ -11,15 +14,31 @@ def dumper(obj):
         return obj.__dict__
 
 def jsonResponseFromDic (dic):
-    return HttpResponse(json.dumps(dic, default=dumper, indent=2), content_type='application/json')
+    return jsonResponseFromString (jsonStringFromDic (dic))
+
+def jsonStringFromDic (dic):
+    return json.dumps(dic, default=dumper, indent=2)
+
+def jsonResponseFromString (jsonString):
+    return HttpResponse(jsonString, content_type='application/json')
 
 def getDecodedRequestBody (request):
     if not request.body:
         return request.body
     if ('Content-Encoding' in request.headers) and ('gzip' in request.headers['Content-Encoding']):
         return gzip.decompress(request.body).decode("utf-8")
+    if ('Content-Encoding' in request.headers) and ('zstd' in request.headers['Content-Encoding']):
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(request.body), read_across_frames=True).read().decode("utf-8")
     return request.body.decode("utf-8")
 
+# iterates over the lines (bytes) of the request body, decompressing it on the fly, without loading it fully in memory
+def iterDecodedRequestLines (request):
+    if ('Content-Encoding' in request.headers) and ('gzip' in request.headers['Content-Encoding']):
+        return gzip.GzipFile(fileobj=request)
+    if ('Content-Encoding' in request.headers) and ('zstd' in request.headers['Content-Encoding']):
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(request, read_across_frames=True))
+    return request
+
 def formatFloat (val):
     if val >= 0.01:
         return "{:.2f}".format(val)
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+# compact representations of the measurements of a sensor track used by the analysis views
+# the dates are kept as sorted numpy datetime64[D] (day index) arrays: they are compared, aligned and sliced as arrays
+# and only formatted to "%Y-%m-%d" strings when the JSON output is built
+
+def toDays (dates):
+    return np.array (dates, dtype='datetime64[D]')
+
+# daily series: a value per day
+class TrackSeries:
+    def __init__ (self, days, values):
+        self.days = days
+        self.values = values
+
+    def __len__ (self):
+        return len (self.days)
+
+    def select (self, mask):
+        return TrackSeries (self.days[mask], self.values[mask])
+
+    def dateStrings (self):
+        return np.datetime_as_string (self.days, unit='D').tolist ()
+
+    # datetime.date objects
+    def dates (self):
+        return self.days.tolist ()
+
+    # points of the line / scatter charts, the suffix is appended to the dates (e.g. the hour)
+    def points (self, suffix = ''):
+        return [{"x": x + suffix, "y": y} for x, y in zip (self.dateStrings (), self.values.tolist ())]
+
+    def toPandas (self):
+        return pd.Series (self.values, index=pd.DatetimeIndex (self.days, name='date'))
+
+    # division by the base series (aligned on the days), the days missing from the base are dropped
+    def divide (self, base):
+        _, indexes, baseIndexes = np.intersect1d (self.days, base.days, assume_unique=True, return_indices=True)
+        return TrackSeries (self.days[indexes], self.values[indexes] / base.values[baseIndexes])
+
+    # sum of several series over the union of their days, without the days summing to 0
+    @staticmethod
+    def sum (seriesList):
+        days = np.unique (np.concatenate ([series.days for series in seriesList])) if seriesList else toDays ([])
+        values = np.zeros (len (days))
+        for series in seriesList:
+            values[np.searchsorted (days, series.days)] += series.values
+        return TrackSeries (days, values).select (values != 0)
+
+    # daily axis covering all the series (from their first to their last day) and series x days matrix of their values, NaN for the days without value
+    @staticmethod
+    def toMatrix (seriesList):
+        nonEmpty = [series for series in seriesList if len (series) > 0]
+        if len (nonEmpty) == 0:
+            return toDays ([]), np.full ((len (seriesList), 0), np.nan)
+        firstDay = min (series.days[0] for series in nonEmpty)
+        days = np.arange (firstDay, max (series.days[-1] for series in nonEmpty) + 1)
+        matrix = np.full ((len (seriesList), len (days)), np.nan)
+        for row, series in enumerate (seriesList):
+            matrix[row, (series.days - firstDay).astype (int)] = series.values
+        return days, matrix
+
+# hourly series: the counts of a day x hour matrix, with NaN for the missing hours
+class HourlyTrackSeries:
+    def __init__ (self, days, counts):
+        self.days = days
+        self.counts = counts
+
+    # rows of the hourly measurements (days are not necessarily unique)
+    @staticmethod
+    def fromColumns (days, hours, counts):
+        uniqueDays, dayIndexes = np.unique (days, return_inverse=True)
+        matrix = np.full ((len (uniqueDays), 24), np.nan)
+        matrix[dayIndexes, hours] = counts
+        return HourlyTrackSeries (uniqueDays, matrix)
+
+    # number of hourly measurements
+    def __len__ (self):
+        return int (np.count_nonzero (~np.isnan (self.counts)))
+
+    def select (self, mask):
+        return HourlyTrackSeries (self.days[mask], self.counts[mask])
+
+    # division by the base hourly series (aligned on the days and hours), the days / hours missing from the base are dropped (NaN)
+    def divide (self, base):
+        _, indexes, baseIndexes = np.intersect1d (self.days, base.days, assume_unique=True, return_indices=True)
+        counts = np.full (self.counts.shape, np.nan)
+        counts[indexes] = self.counts[indexes] / base.counts[baseIndexes]
+        return HourlyTrackSeries (self.days, counts)
+
+    # sum of several hourly series over the union of their days, the hours summing to 0 (or without any measurement) being NaN
+    @staticmethod
+    def sum (seriesList):
+        days = np.unique (np.concatenate ([series.days for series in seriesList])) if seriesList else toDays ([])
+        counts = np.zeros ((len (days), 24))
+        for series in seriesList:
+            counts[np.searchsorted (days, series.days)] += np.nan_to_num (series.counts, nan=0)
+        counts[counts == 0] = np.nan
+        available = ~np.isnan (counts).all (axis=1)
+        return HourlyTrackSeries (days[available], counts[available])
+
+    # daily series of the measurements at the given hour
+    def hour (self, h):
+        available = ~np.isnan (self.counts[:, h])
+        return TrackSeries (self.days[available], self.counts[available, h])
+
+    # hours having at least a measurement, with the mean and the number of their measurements
+    def hourlyMeans (self):
+        available = ~np.isnan (self.counts)
+        samples = available.sum (axis=0)
+        return [(int (h), np.mean (self.counts[available[:, h], h]), int (samples[h])) for h in np.nonzero (samples)[0]]
+
+# line chart points of a pandas series indexed by dates
+def getPandasPoints (series):
+    return [{"x": x, "y": y} for x, y in zip (series.index.strftime ("%Y-%m-%d"), series.tolist ())]
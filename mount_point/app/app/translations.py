@@ -182,5 +182,9 @@ globalTranslationDic['nl'] = {
 "End date is not valid":"Einddatum is niet geldig",
 "Time window ends before its start. Please correct":"Tijdvenster eindigt voordat het begint. Gelieve te corrigeren",
 'Fatal error occured':'Er is een fatale fout opgetreden',
-'Please notify your IT team about the accident and how have you reached it':'Informeer uw IT-team over het ongeval en hoe u het heeft bereikt'
+'Please notify your IT team about the accident and how have you reached it':'Informeer uw IT-team over het ongeval en hoe u het heeft bereikt',
+'Fit timed out':'Time-out bij het fitten van het model',
+'Fast extrapolation engine: each day is predicted by the last observed value of the same weekday, instead of the SARIMAX methodology described below.<br/>':'Snelle extrapolatiemethode: elke dag wordt voorspeld door de laatst waargenomen waarde van dezelfde weekdag, in plaats van de hieronder beschreven SARIMAX-methodologie.<br/>',
+'Fast extrapolation engine: additive Holt-Winters exponential smoothing (level, trend and weekly pattern), instead of the SARIMAX methodology described below.<br/>':'Snelle extrapolatiemethode: additieve Holt-Winters exponentiële afvlakking (niveau, trend en weekpatroon), in plaats van de hieronder beschreven SARIMAX-methodologie.<br/>',
+"The extrapolation model couldn't be fitted in time for the following sensors, please retry later or shorten the time window 1: <br/>":"Het extrapolatiemodel kon niet op tijd gefit worden voor de volgende sensoren, probeer het later opnieuw of verkort tijdvenster 1: <br/>"
 }
\ No newline at end of file
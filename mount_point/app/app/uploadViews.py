@@ -4,6 +4,7 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 from django.core.mail import send_mail
 from datetime import datetime
 from django.core.files.storage import FileSystemStorage
@@ -17,126 +18,141 @@ import json
 import traceback
 import os
 import csv
+import codecs
 
 import app.models
+import app.ingestion
+from app.tools import jsonResponseFromDic, iterDecodedRequestLines
+import app.qualityJobs
 
 # parsing and handling the data from the API push request. 
+# the counts of each track are queued for the quality checks as soon as they are written, the ones written before an error thus stay consistent
 # use @protected_resource() decorator to enforce the OAuth verification
 @csrf_exempt
 def pushData (request):
+    cnt = 0
+    ecnt = 0
+    skipped = 0
     try:
         payload = json.loads (request.body)
         for cSensor in payload['sensors']:
             cS = app.models.Sensor.objects.filter (ref=cSensor['ref']).first()
             if cS:
                 cS.location = json.dumps (cSensor['location'])
-                cS.sensorType = app.models.SensorType.objects.get (name=cSensor['sensorType'])
+                cS.sensorType = app.models.sensorTypeRegistry.getOrCreate (cSensor['sensorType'])
                 cS.meta = json.dumps (cSensor['meta'])
                 cS.save ()
             else:
-                sensorType = app.models.SensorType.objects.filter (name=cSensor['sensorType']).first ()
-                if not sensorType:
-                    sensorType = app.models.SensorType.objects.create (name=cSensor['sensorType'])
+                sensorType = app.models.sensorTypeRegistry.getOrCreate (cSensor['sensorType'])
                 cS = app.models.Sensor.objects.create (ref=cSensor['ref'], location=json.dumps (cSensor['location']), hasReverse=False,  meta=json.dumps (cSensor['meta']), sensorType=sensorType)
             modalities = set()
             hadReverse = False
             for track in cSensor['tracks']:
-                mod = app.models.Modality.objects.filter (name=track['modality']).first ()
-                if not mod:
-                    mod = app.models.Modality.objects.create (name=track['modality'])
+                mod = app.models.modalityRegistry.getOrCreate (track['modality'])
                 modalities.add (mod)
                 cTrack = cS.tracks.filter (isReverseChannel=track['isReverse']).filter (modality=mod).first ()
                 if not cTrack:
                     cTrack = app.models.SensorTrack.objects.create (sensor=cS, isReverseChannel=track['isReverse'], modality=mod)
                 if track['isReverse']:
                     hadReverse = True
-                for count in track['counts']:
-                    cdate = datetime.strptime (count['date'], "%Y-%m-%d").date()
-                    cCount = cTrack.hMeasurements.filter (date=cdate).filter (hour=count['hour']).first()
-                    if cCount:
-                        cCount.count = count['count']
-                        cCount.save()
-                    else:
-                        app.models.HMeasurement.objects.create (sensor=cTrack, date=cdate, hour=count['hour'], count=count['count'])
-                cTrack.exploreDataConsistency()
+                counts = parsePushedCounts (track['counts'])
+                #the fingerprint of the block is only committed along with its counts and quality job
+                with transaction.atomic ():
+                    inserted, updated, isSkipped = cTrack.ingestCountsBlock (counts)
+                    if (len (counts) > 0) and not isSkipped:
+                        app.qualityJobs.markTracksDirty ([(cTrack, min (c[0] for c in counts), max (c[0] for c in counts))])
+                cnt += inserted
+                ecnt += updated
+                skipped += 1 if isSkipped else 0
             cS.hasReverse = hadReverse
             cS.availableModalities.set (modalities)
             cS.save()
     except:
         print (traceback.format_exc())
-    return HttpResponse ("Got it")
+        return HttpResponse ("Error occurred after " + str (cnt) + " hourly counts inserted, " + str (ecnt) + " updated", status=500)
+    return HttpResponse ("Got it: " + str (cnt) + " hourly counts inserted, " + str (ecnt) + " updated, " + str (skipped) + " unchanged count blocks skipped")
+
+# streaming variant of pushData, the body being newline-delimited JSON where each line is either:
+# - a sensor with the same structure as the items of the "sensors" list of pushData
+# - a batch of counts for a track of an existing sensor: {"ref": SENSOR_REF, "modality": "Car", "isReverse": false, "counts": [{"date":..., "hour":..., "count":...}]}
+# the body can be compressed (Content-Encoding gzip or zstd); it is decompressed and processed line by line, never fully loaded in memory
+# an incorrect line is reported and skipped, while a failed write of the buffered counts aborts the processing (the counts of the previous batches being kept)
+# use @protected_resource() decorator to enforce the OAuth verification
+@csrf_exempt
+def pushNDJSON (request):
+    importer = app.ingestion.CountsImporter ()
+    errors = []
+    lineCounter = 0
+    try:
+        for line in iterDecodedRequestLines (request):
+            lineCounter += 1
+            if not line.strip ():
+                continue
+            try:
+                item = json.loads (line)
+                if 'tracks' in item:
+                    importer.addSensor (item['ref'], item['sensorType'], json.dumps (item['location']), json.dumps (item['meta']))
+                    for track in item['tracks']:
+                        importer.addCountsBlock (item['ref'], track['modality'], track['isReverse'], parsePushedCounts (track['counts']))
+                else:
+                    importer.addCountsBlock (item['ref'], item['modality'], item['isReverse'], parsePushedCounts (item['counts']))
+            except app.ingestion.BatchWriteError:
+                raise
+            except Exception as e:
+                print (traceback.format_exc())
+                errors.append ({'line': lineCounter, 'error': repr (e)})
+        importer.finish ()
+    except Exception as e:
+        print (traceback.format_exc())
+        return jsonResponseFromDic ({'status': 'error_occurred', 'error': repr (e), 'lines': lineCounter, 'inserted': importer.inserted, 'updated': importer.updated, 'errors': errors})
+    finally:
+        importer.close ()
+    return jsonResponseFromDic ({'status': 'ok', 'lines': lineCounter, 'inserted': importer.inserted, 'updated': importer.updated, 'skippedBlocks': importer.skippedBlocks, 'errors': errors})
+
+def parsePushedCounts (counts):
+    return [(datetime.strptime (count['date'], "%Y-%m-%d").date(), count['hour'], count['count']) for count in counts]
+
+# columnar upload (Parquet or Arrow IPC file in the "upload" field), with the same columns as the CSV upload
+# the format is taken from the "format" field ("parquet" or "arrow") or guessed from the file extension
+# use @protected_resource() decorator to enforce the OAuth verification
+@csrf_exempt
+def uploadColumnar (request):
+    if request.method != 'POST' or 'upload' not in request.FILES:
+        return jsonResponseFromDic ({'status': 'error_occurred', 'error': 'A Parquet or Arrow file is expected in the upload field'})
+    upload = request.FILES['upload']
+    fileFormat = request.POST.get ('format') or app.ingestion.getColumnarFormat (upload.name)
+    if fileFormat not in ['parquet', 'arrow']:
+        return jsonResponseFromDic ({'status': 'error_occurred', 'error': 'Unknown file format'})
+    importer = app.ingestion.CountsImporter ()
+    try:
+        app.ingestion.importColumnarFile (importer, upload.file, fileFormat)
+        inserted, updated = importer.finish ()
+    except:
+        print (traceback.format_exc())
+        return jsonResponseFromDic ({'status': 'error_occurred', 'inserted': importer.inserted, 'updated': importer.updated})
+    finally:
+        importer.close ()
+    return jsonResponseFromDic ({'status': 'ok', 'inserted': inserted, 'updated': updated})
 
 # CSV upload view and parsing script
 # expects the following columns: sensor_type,sensor_ref,modality,is_reverse_channel,date,hour,count,meta
+# the uploaded file is read line by line and written in batches, so the memory usage stays flat whatever the file size is
+# on an incorrect row, the batches written before it are kept (and queued for the quality checks)
 # use @login_required decorator to password protect
 def uploadCSV(request):
     if request.method == 'POST' and request.FILES['upload']:
-        newData = {}
-        sensorType = {}
-        sensorLocation = {}
-        sensorMeta = {}
-        decoded_file = request.FILES['upload'].read().decode('utf-8').splitlines()
-        reader = csv.DictReader(decoded_file)
-        cnt = 0
-        for row in reader:
-            ref = row['sensor_ref']
-            if ref not in newData:
-                newData[ref] = {}
-                sensorType[ref] = row['sensor_type']
-                sensorMeta[ref] = row['meta']
-                sensorLocation[ref] = row['location']
-            mod = row['modality']
-            if mod not in newData[ref]:
-                newData[ref][mod] = {}
-            rev = row['is_reverse_channel']
-            if rev not in newData[ref][mod]:
-                newData[ref][mod][rev] = []
-            
-            newData[ref][mod][rev].append ((datetime.strptime (row['date'], "%Y-%m-%d").date(), row['hour'], row['count']))
-            cnt += 1
-        ecnt = 0
-        cnt = 0
-        for ref in newData:
-            cType = app.models.SensorType.objects.filter (name=sensorType[ref]).first()
-            if not cType:
-                cType = app.models.SensorType.objects.create (name=sensorType[ref])
-            cS = app.models.Sensor.objects.filter (ref=ref).first()
-            if cS:
-                cS.location = sensorLocation[ref]
-                cS.sensorType = cType
-                cS.meta = sensorMeta[ref]
-                cS.save ()
-            else:
-                cS = app.models.Sensor.objects.create (ref=ref, location=sensorLocation[ref], hasReverse=False, meta=sensorMeta[ref], sensorType=cType)
-            for cMod in newData[ref]:
-                mod = app.models.Modality.objects.filter (name=cMod).first ()
-                if not mod:
-                    mod = app.models.Modality.objects.create (name=cMod)
-                
-                for isRev in newData[ref][cMod]:
-                    cTrack = cS.tracks.filter (isReverseChannel=isRev).filter (modality=mod).first ()
-                    if not cTrack:
-                        cTrack = app.models.SensorTrack.objects.create (sensor=cS, isReverseChannel=isRev, modality=mod)
-                    
-                    for count in newData[ref][cMod][isRev]:
-                        cCount = cTrack.hMeasurements.filter (date=count[0]).filter (hour=count[1]).first()
-                        if cCount:
-                            cCount.count = count[2]
-                            cCount.save()
-                            ecnt += 1
-                        else:
-                            app.models.HMeasurement.objects.create (sensor=cTrack, date=count[0], hour=count[1], count=count[2])
-                            cnt += 1
-                    cTrack.exploreDataConsistency()
-            
-            modalities = set()
-            hasReverse = False
-            for cTrack in cS.tracks.all ():
-                modalities.add (cTrack.modality)
-                hasReverse = hasReverse or cTrack.isReverseChannel
-            cS.hasReverse = hasReverse
-            cS.availableModalities.set (modalities)
-            cS.save()
-        return render(request, 'csvupload.html', {'messages': ['File uploaded successfully']})
+        reader = csv.DictReader(codecs.iterdecode (request.FILES['upload'], 'utf-8'))
+        importer = app.ingestion.CountsImporter ()
+        try:
+            for row in reader:
+                if row['sensor_ref'] not in importer.sensors:
+                    importer.addSensor (row['sensor_ref'], row['sensor_type'], row['location'], row['meta'])
+                importer.addCount (row['sensor_ref'], row['modality'], row['is_reverse_channel'], datetime.strptime (row['date'], "%Y-%m-%d").date(), row['hour'], row['count'])
+            cnt, ecnt = importer.finish ()
+        except:
+            print (traceback.format_exc())
+            return render(request, 'csvupload.html', {'messages': ['Error while processing line ' + str (reader.line_num) + ' of the file', str (importer.inserted) + ' hourly counts inserted, ' + str (importer.updated) + ' updated before it']})
+        finally:
+            importer.close ()
+        return render(request, 'csvupload.html', {'messages': ['File uploaded successfully', str (cnt) + ' hourly counts inserted, ' + str (ecnt) + ' updated']})
     return render(request, 'csvupload.html')
-
@@ -25,7 +25,10 @@ urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),
     path('', views.index),
     path('api/api', views.genericAPIRequest),
+    path('api/sensorsCollection', views.sensorsCollection),
     path("upload/csv/", uploadViews.uploadCSV),
+    path("upload/columnar/", uploadViews.uploadColumnar),
     path('pushData', uploadViews.pushData),
+    path('pushData/ndjson', uploadViews.pushNDJSON),
     path('o/', include('oauth2_provider.urls', namespace='oauth2_provider')),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -1,4 +1,4 @@
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotModified, StreamingHttpResponse
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
@@ -6,6 +6,10 @@ from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.core.mail import send_mail
 from django.utils.timezone import make_aware
+from django.db import connections
+from django.db.models import Q, Exists, OuterRef
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.utils.http import parse_etags
 from oauth2_provider.decorators import protected_resource
 
 import os
@@ -13,25 +17,28 @@ import pickle
 import json
 import traceback
 import os
-import holidays
 import csv
+import zlib
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-from dateutil.parser import parse, isoparse
-from datetime import datetime, time, timedelta
+from dateutil.parser import isoparse
+from datetime import time, timedelta
 from random import randint 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from scipy.stats import kstest
 from statsmodels.tsa.seasonal import seasonal_decompose
-from statsmodels.tsa.statespace.sarimax import SARIMAX
 
 import app.models
+import app.responseCache
+import app.forecasting
 from app.translations import getTranslatedString
-from app.tools import jsonResponseFromDic, getDecodedRequestBody, formatFloat
-
-# TODO: avoid the hardcoded year
-BE_HOLIDAYS = [holiday[0] for holiday in holidays.Belgium (years=[2021]).items()]
+from app.tools import jsonResponseFromDic, jsonResponseFromString, jsonStringFromDic, getDecodedRequestBody, formatFloat
+from app.dataLoader import BE_HOLIDAYS, WEEK_DAYS, FILTERING_TESTS, getFromToFromTimePeriod, MeasurementsLoader
+from app.trackSeries import TrackSeries, HourlyTrackSeries, getPandasPoints, toDays
 
 # p-value threshold for Kolmogorov-Smirnov tests
 pThreshold = 0.05
@@ -47,7 +54,7 @@ def genericAPIRequest (request):
     try:
         ajaxRequest = json.loads(getDecodedRequestBody(request))
         endpoint = ajaxRequest['endpoint']
-        res = serveAPIRequest (ajaxRequest, endpoint)
+        res = serveAPIRequest (ajaxRequest, endpoint, request)
         if type (res) == dict:
             return jsonResponseFromDic (res)
         else:
@@ -56,111 +63,165 @@ def genericAPIRequest (request):
         print (traceback.format_exc())
         return jsonResponseFromDic ({'status':'error_occurred'})
 
+# GET variant of the getSensorsCollection endpoint, letting the browser cache revalidate the collection with If-None-Match
+@protected_resource()
+def sensorsCollection (request):
+    try:
+        return getSensorsCollection ({}, request.headers.get ('If-None-Match'))
+    except: 
+        print (traceback.format_exc())
+        return jsonResponseFromDic ({'status':'error_occurred'})
+
 # verification that the endpoint requested via the API is valid and its treatment
-def serveAPIRequest (ajaxRequest, endpoint):
-    if endpoint in ['getSensorsCollection', 'getSensorCard', 'getSensorCards', 'getMultiSourceTrack']:
+def serveAPIRequest (ajaxRequest, endpoint, request = None):
+    if endpoint == 'getSensorsCollection':
+        return getSensorsCollection (ajaxRequest, request.headers.get ('If-None-Match') if request else None)
+    if endpoint in ['getSensorCard', 'getSensorCards', 'getMultiSourceTrack']:
         return globals()[endpoint] (ajaxRequest)
     return {'status':'error_occurred', 'error': 'incorrect endpoint'}
 
 # return all the available sensors via API
-def getSensorsCollection (request):
+# the serialized collection is cached under a data version bumped on every change of the sensors or of their summaries (see app.models.invalidateSensorsCollection)
+# the version is also the ETag of the response: a client sending it back in If-None-Match gets a 304 without the collection being rebuilt or sent
+def getSensorsCollection (ajaxRequest, ifNoneMatch = None):
+    version = app.responseCache.getDataVersion (app.responseCache.SENSORS_COLLECTION)
+    etag = app.responseCache.getETag (version)
+    if ifNoneMatch and (etag in parse_etags (ifNoneMatch) or ifNoneMatch.strip () == '*'):
+        response = HttpResponseNotModified ()
+    else:
+        response = HttpResponse (app.responseCache.getCachedResponse (app.responseCache.SENSORS_COLLECTION, version, buildSensorsCollection))
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+# serialization of all the available sensors with their quality
+# based on the SensorTrackSummary maintained by the quality pipeline: a single query, with the modalities aggregated per track
+def buildSensorsCollection ():
     res = []
-    allTestsTest = app.models.QualityValidationTest.objects.filter (name='AllTests').first()
-    if not allTestsTest:
-        return HttpResponse (json.dumps({"status":"ok", "sensorCards": []}))
-    for sensor in app.models.Sensor.objects.all ():
-        card = sensor.card()
-        trackQualities = []
-        for track in sensor.tracks.all ():
-            datesSpan = track.availableDatesSpan()
-            if datesSpan:
-                trackQualities.append (track.qualityValidationResults.filter (test=allTestsTest).filter (passed=True).count() / ((datesSpan[1] - datesSpan[0]).days + 1))
-        if len (trackQualities) > 0:
-            card['quality'] = 100 * np.mean (trackQualities)
-            res.append (card)
-	
-    return HttpResponse (json.dumps({"status":"ok", "sensorCards": res}))
+    summaries = app.models.SensorTrackSummary.objects.filter (firstDate__isnull = False).select_related ('sensor__sensor__sensorType').annotate (
+        modalityNames = ArrayAgg ('sensor__sensor__availableModalities__name', distinct = True, filter = Q (sensor__sensor__availableModalities__isnull = False))
+    ).order_by ('sensor__sensor__id', 'sensor__id')
+    sensorToSummaries = defaultdict (list)
+    for summary in summaries:
+        sensorToSummaries[summary.sensor.sensor_id].append (summary)
+    for sensorSummaries in sensorToSummaries.values ():
+        card = sensorSummaries[0].sensor.sensor.card (sensorSummaries[0].modalityNames or [])
+        card['quality'] = 100 * np.mean ([summary.quality () for summary in sensorSummaries])
+        res.append (card)
+    return json.dumps({"status":"ok", "sensorCards": res})
 
 # return a particular sensor (with specified ref; if any) via API
 def getSensorCard (ajaxRequest):
     ref = ajaxRequest['ref']
-    cS = app.models.Sensor.objects.filter (ref=ref).first ()
-    if not cS:
+    sensors = getSensorsForRefs ([ref])
+    if ref not in sensors:
         print ('no sensor' + ref)
         return {'status': 'error_occurred', 'error': 'No sensor found'}
-    return {'status': 'ok', 'sensor': cS.card()}
+    return {'status': 'ok', 'sensor': sensors[ref].card()}
 
 # return particulars sensor (with ref in "refs" param; if any) via API
 def getSensorCards (ajaxRequest):
     refs = ajaxRequest['refs']
     if not refs:
         return {'status': 'ok', 'sensors': []}
+    refs = [ref.strip() for ref in refs.split (',')]
+    sensors = getSensorsForRefs (refs)
     cards = []
-    for ref in refs.split (','):
-        cS = app.models.Sensor.objects.filter (ref=ref.strip()).first ()
-        if not cS:
+    for ref in refs:
+        if ref not in sensors:
             print ('no sensor' + ref)
             continue
-        cards.append (cS.card())
+        cards.append (sensors[ref].card())
     return {'status': 'ok', 'sensors': cards}
 
-# created a DataFrame from the collection of daily measurements
+# ref -> Sensor dictionary of the sensors with the given refs, loaded with their sensor type and modalities (3 queries whatever the number of refs)
+# if several sensors share a ref, the first created one is kept
+def getSensorsForRefs (refs):
+    res = {}
+    for cS in app.models.Sensor.objects.filter (ref__in = set (refs)).select_related ('sensorType').prefetch_related ('availableModalities').order_by ('id'):
+        if cS.ref not in res:
+            res[cS.ref] = cS
+    return res
+
+# created a DataFrame from the daily series (TrackSeries) of a track
 # if there are gaps in data, they are filled with the previous observed count (the last available day)
 # isReal column keeps track if it is a real observed value or a filled in
 # no weekly pattern is imposed, just filling the blanks
 # the gap filling is done to further use in weekly patterns detection for example
-def convertMeasurementsToDF (dMeasurements): 
-    dateToVal = {d['date'].strftime ("%Y-%m-%d"):d['count_sum'] for d in dMeasurements}
-    data = []
-    for date in pd.date_range (min(dateToVal.keys()), max(dateToVal.keys())):
-        dateString = date.strftime ("%Y-%m-%d")
-        if dateString in dateToVal:
-            data.append ([date, dateToVal[dateString], True])
-        else:
-            data.append ([date, None, False])
-    df = pd.DataFrame (data, columns=["date", "countSum", "isReal"])
-    df.set_index ('date', inplace=True)
+def convertMeasurementsToDF (series): 
+    countSums = series.toPandas ()
+    df = pd.DataFrame ({"countSum": countSums.reindex (pd.date_range (countSums.index.min (), countSums.index.max (), name='date'))})
+    df["isReal"] = df.index.isin (countSums.index)
     df.fillna(method="ffill", inplace=True)
     return df
 
 # decomposition in trend/weekly/residual components
-def getTrueSeasonalDecompose (dMeasurements):
-    df = convertMeasurementsToDF (dMeasurements)
+def getTrueSeasonalDecompose (series):
+    df = convertMeasurementsToDF (series)
     decomp = seasonal_decompose(df['countSum'], model='additive', period=7, extrapolate_trend='freq')
     df = df.merge (decomp.trend.rename ("trend"), left_index=True, right_index=True)
     df = df.merge (decomp.seasonal.rename ("seasonal"), left_index=True, right_index=True)
     df = df.merge (decomp.resid.rename ("resid"), left_index=True, right_index=True)
     return df[df.isReal == True].reset_index(), df
 
-# parse datetime from and to objects from timePeriods coming from the API request
-def getFromToFromTimePeriod (timePeriod):
-    try:
-        tpFrom = parse (str(timePeriod['from'])) if isinstance(timePeriod['from'], str) else  datetime.fromtimestamp (timePeriod['from']/ 1000)
-    except:
-        tpFrom = None
-    try:
-        tpTo = parse (str(timePeriod['to'])) if isinstance(timePeriod['to'], str) else  datetime.fromtimestamp (timePeriod['to']/ 1000)
-    except:
-        tpTo = None
-    return tpFrom, tpTo
+# runs the extrapolation model fits (see app.forecasting.fitAndPredictAll) and sets the data of the corresponding prediction lines
+# the lines of the fits that timed out are left without data; returns their labels
+def fillPredictionLines (predictionLines, fits):
+    timedOutTracks = []
+    for line, prediction in zip (predictionLines, app.forecasting.fitAndPredictAll (fits)):
+        if prediction is None:
+            timedOutTracks.append (line["label"])
+        else:
+            line["data"] = getPandasPoints (prediction)
+    return timedOutTracks
+
+# sets the data of the prediction lines with the exponential smoothing engine (see app.forecasting.smoothingPredict), all the series being predicted at once
+def fillSmoothingPredictionLines (engine, predictionLines, seriesList, predictionFrom, predictionTo):
+    if len (seriesList) == 0:
+        return
+    days, values = TrackSeries.toMatrix (seriesList)
+    predictionDays = np.arange (np.datetime64 (predictionFrom.date ()), np.datetime64 (predictionTo.date ()) + 1)
+    horizon = max (0, int ((predictionDays[-1] - days[-1]).astype (int))) if len (predictionDays) > 0 else 0
+    axis = np.concatenate ([days, days[-1] + np.arange (1, horizon + 1)])
+    predictions = app.forecasting.smoothingPredict (engine, values, horizon)
+    mask = (axis >= predictionDays[0]) & (axis <= predictionDays[-1]) if len (predictionDays) > 0 else np.zeros (len (axis), dtype=bool)
+    for line, prediction in zip (predictionLines, predictions):
+        line["data"] = TrackSeries (axis[mask], prediction[mask]).points ()
+
+def getSmoothingEngineDescription (engine, lang):
+    if engine == app.forecasting.SEASONAL_NAIVE_ENGINE:
+        return getTranslatedString ('Fast extrapolation engine: each day is predicted by the last observed value of the same weekday, instead of the SARIMAX methodology described below.<br/>', lang)
+    return getTranslatedString ('Fast extrapolation engine: additive Holt-Winters exponential smoothing (level, trend and weekly pattern), instead of the SARIMAX methodology described below.<br/>', lang)
+
+def getFitTimedOutItem (timedOutTracks, lang):
+    return {
+        "type": 'text',
+        "title": getTranslatedString ('Fit timed out', lang),
+        "subtitle": getTranslatedString ("The extrapolation model couldn't be fitted in time for the following sensors, please retry later or shorten the time window 1: <br/>", lang) + "<br/>".join (timedOutTracks),
+        "isError": True,
+        "isTransient": True
+    }
+
+# true if some of the items (or of their children) are transient errors (e.g. a fit timed out or a view that failed), such results are not cached
+def hasTransientItem (items):
+    return any (item.get ("isTransient") or hasTransientItem (item.get ("children", [])) for item in items)
 
 # filter only the measurements following the configuration of the timePeriod (dates / day types / holidays / tests passed)
+# compiled into a single query: the days failing the disabled tests are excluded with an anti-join on the quality results instead of a list of dates
 def filterMeasurementsForTimePeriod (measurements, timePeriod, sensorTrack):
     tpFrom, tpTo = getFromToFromTimePeriod (timePeriod)
     res = measurements.filter (date__gte = tpFrom).filter (date__lte = tpTo)
-    for dayCounter, day in enumerate(['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']):
-        if not timePeriod[day]:
-            res = res.exclude (date__week_day = dayCounter + 1)
+    excludedWeekDays = [dayCounter + 1 for dayCounter, day in enumerate(WEEK_DAYS) if not timePeriod[day]]
+    if excludedWeekDays:
+        res = res.exclude (date__week_day__in = excludedWeekDays)
     if not timePeriod['Holiday']:
         res = res.exclude (date__in = BE_HOLIDAYS)
     if not timePeriod['Non-holiday']:
         res = res.filter (date__in = BE_HOLIDAYS)
-    for testName in ['PerformanceThreshold', 'MinThreshold', 'DBSCAN']:
-        if not timePeriod[testName]:
-            cTest = app.models.QualityValidationTest.objects.filter (name__iexact = testName).first()
-            if cTest:
-                failedDates = [qvr['date'] for qvr in sensorTrack.qualityValidationResults.filter (passed=False).filter (date__gte = tpFrom).filter (date__lte = tpTo).filter (test=cTest).values ('date') ]
-                res = res.exclude (date__in = failedDates)
+    failingTestIds = [app.models.qualityValidationTestRegistry.id (testName) for testName in FILTERING_TESTS if not timePeriod[testName]]
+    failingTestIds = [testId for testId in failingTestIds if testId]
+    if failingTestIds:
+        res = res.exclude (Exists (app.models.QualityValidationResult.objects.filter (sensor = sensorTrack).filter (date = OuterRef ('date')).filter (passed = False).filter (test_id__in = failingTestIds)))
     return res.order_by('date')
 
 # main routine for the analysis page
@@ -181,7 +242,7 @@ def getMultiSourceTrack (ajaxRequest):
                     continue
                     
                 if modality != 'All':
-                    cT = cS.tracks.filter (modality__name = modality).filter (isReverseChannel = isReverse).first ()
+                    cT = cS.tracks.filter (modality = app.models.modalityRegistry.get (modality)).filter (isReverseChannel = isReverse).first ()
                     if not cT:
                         return {'status': 'error_occurred', 'error': 'Incorrect sensor-modality-reverse combination'}
                     cTs.append (cT)
@@ -192,88 +253,265 @@ def getMultiSourceTrack (ajaxRequest):
     basePopulationSensorRef = ajaxRequest['basePopulationSensorRef'] if 'basePopulationSensorRef' in ajaxRequest else None
     if basePopulationSensorRef not in refModalityReverseCombinations:
         basePopulationSensorRef = None
+    #a list of viewTypes is answered with the results of each of them (multiSourceTracksByViewType)
+    viewTypes = list (dict.fromkeys (viewType)) if isinstance (viewType, list) else [viewType]
+    #the raw data export is a file, it can't be combined with the analysis views
+    if isinstance (viewType, list) and ('extractRawCSVData' in viewTypes):
+        return {'status': 'error_occurred', 'error': 'extractRawCSVData can not be requested in a list of viewTypes'}
     if viewType == 'extractRawCSVData':
-        return extractRawCSVData (cTs, timePeriods)
+        return extractRawCSVData (cTs, timePeriods, ajaxRequest.get ('gzip', False), ajaxRequest.get ('exportFormat', 'csv'))
     if len (cTs) == 0:
-        return {'status': 'ok', 'multiSourceTracks': { "contents": [{
+        return getAnalysisResponse (viewType, {viewTypeItem: [{
                 "type": 'text',
                 "title": getTranslatedString ('No sensor tracks selected', lang),
                 "subtitle":  getTranslatedString ('Please select the desired modalities for each sensor in the left menu', lang),
                 "isError": True
-        }] }}
+        }] for viewTypeItem in viewTypes})
     if len (timePeriods) == 0:
-        return {'status': 'ok', 'multiSourceTracks': { "contents": [{
+        return getAnalysisResponse (viewType, {viewTypeItem: [{
                 "type": 'text',
                 "title": getTranslatedString ('No time windows configured', lang),
                 "subtitle":  getTranslatedString ('Please create and configure at least one time window in the left menu', lang),
                 "isError": True
-        }] }}
-    return {'status': 'ok', 'multiSourceTracks': { "contents":fillSensorTracks (cTs, timePeriods, viewType, True, basePopulationSensorRef, lang) }}
+        }] for viewTypeItem in viewTypes})
+    engine = ajaxRequest['engine'] if ajaxRequest.get ('engine') in app.forecasting.EXTRAPOLATION_ENGINES else None
+    keys = getAnalysisCacheKeys (cTs, timePeriods, viewTypes, basePopulationSensorRef, lang, engine)
+    contents = {viewTypeItem: app.responseCache.analysisCache.get (keys[viewTypeItem]) for viewTypeItem in viewTypes}
+    missingViewTypes = [viewTypeItem for viewTypeItem in viewTypes if contents[viewTypeItem] is None]
+    for viewTypeItem, result in fillSensorTracksForViewTypes (cTs, timePeriods, missingViewTypes, True, basePopulationSensorRef, lang, engine).items ():
+        contents[viewTypeItem] = jsonStringFromDic (result)
+        if not hasTransientItem (result):
+            app.responseCache.analysisCache.set (keys[viewTypeItem], contents[viewTypeItem])
+    return jsonResponseFromString (getAnalysisResponseString (viewType, contents))
 
-# creation of the in-memory CSV export file based on selected sensorTracks (cTs) and timePeriods
-def extractRawCSVData (cTs, timePeriods):
-    response = HttpResponse(content_type='text/plain')  
-    response['Content-Disposition'] = 'attachment; filename="export.csv"'
-    writer = csv.writer(response)
-    writer.writerow(["sensor_ref", "modality", "is_reverse_channel", "time_period_counter", "date", "hour", "count"])
-    for cTCounter, cT in enumerate(cTs):
-        for timePeriodCounter, timePeriod in enumerate(timePeriods):
-            hMeasurements = filterMeasurementsForTimePeriod(cT.hMeasurements, timePeriod, cT).exclude(count=float('nan')).values ('date', 'count', "hour")
-            for hM in hMeasurements:
-                writer.writerow([cT.sensor.ref, cT.modality.name, cT.isReverseChannel, timePeriodCounter, hM['date'].strftime ("%Y-%m-%d"), hM['hour'], hM['count']])
+# response of the analysis endpoint with the contents of each viewType (viewType -> list of primitive views)
+# {"multiSourceTracks": {"contents": ...}} for a single viewType, {"multiSourceTracksByViewType": {viewType: {"contents": ...}}} for a list of viewTypes
+def getAnalysisResponse (viewType, contents):
+    if isinstance (viewType, list):
+        return {'status': 'ok', 'multiSourceTracksByViewType': {viewTypeItem: {"contents": contents[viewTypeItem]} for viewTypeItem in contents}}
+    return {'status': 'ok', 'multiSourceTracks': {"contents": contents[viewType]}}
+
+# same as getAnalysisResponse, with the contents already serialized (as cached): they are inserted in the response without being parsed again
+def getAnalysisResponseString (viewType, contentStrings):
+    if isinstance (viewType, list):
+        return '{"status": "ok", "multiSourceTracksByViewType": {' + ', '.join (json.dumps (viewTypeItem) + ': {"contents": ' + contentStrings[viewTypeItem] + '}' for viewTypeItem in contentStrings) + '}}'
+    return '{"status": "ok", "multiSourceTracks": {"contents": ' + contentStrings[viewType] + '}}'
+
+# keys of the analysis results cache (app.responseCache.analysisCache) for the viewTypes of a getMultiSourceTrack request
+# the tracks are kept in the request order (it determines the colors of the charts), the time periods are normalized (parsed bounds, sorted fields)
+# and the data versions of the tracks and of the base population tracks make the keys change as soon as their measurements or quality results are updated
+def getAnalysisCacheKeys (cTs, timePeriods, viewTypes, basePopulationSensorRef, lang, engine = None):
+    normalizedTimePeriods = [normalizeTimePeriod (timePeriod) for timePeriod in timePeriods]
+    versions = list (app.models.SensorTrack.objects.filter (Q (id__in = [cT.id for cT in cTs]) | Q (sensor__ref = basePopulationSensorRef)).order_by ('id').values_list ('id', 'dataVersion'))
+    return {viewType: json.dumps ([viewType, lang, basePopulationSensorRef, [cT.id for cT in cTs], normalizedTimePeriods, versions, engine], sort_keys=True, default=str) for viewType in viewTypes}
+
+# timePeriod with the parsed bounds, to be used in the cache keys
+def normalizeTimePeriod (timePeriod):
+    tpFrom, tpTo = getFromToFromTimePeriod (timePeriod)
+    return dict (timePeriod, **{'from': tpFrom.isoformat () if tpFrom else None, 'to': tpTo.isoformat () if tpTo else None})
+
+# data versions of the tracks (trackId -> dataVersion) and of the base population tracks ((trackId, dataVersion) list), used in the fitted models cache keys
+def getDataVersions (cTs, basePopulationSensorRef):
+    versions = {}
+    baseVersions = []
+    for trackId, ref, dataVersion in app.models.SensorTrack.objects.filter (Q (id__in = [cT.id for cT in cTs]) | Q (sensor__ref = basePopulationSensorRef)).order_by ('id').values_list ('id', 'sensor__ref', 'dataVersion'):
+        versions[trackId] = dataVersion
+        if basePopulationSensorRef and ref == basePopulationSensorRef:
+            baseVersions.append ((trackId, dataVersion))
+    return versions, baseVersions
+
+# key of a model in the fitted models cache (see app.forecasting.fitAndPredict)
+# a model is fitted on the data of the given tracks (predicted track first, then the exogenous ones) in the training time window, possibly divided by the base population
+def getFittedModelKey (spec, cTs, trainingTimePeriod, basePopulationSensorRef, dataVersions):
+    versions, baseVersions = dataVersions
+    return json.dumps ([spec, [(cT.id, versions.get (cT.id)) for cT in cTs], normalizeTimePeriod (trainingTimePeriod), basePopulationSensorRef, baseVersions], sort_keys=True, default=str)
+
+# warm start key of a model (see app.forecasting.fitAndPredict): same as getFittedModelKey, without the data versions nor the bounds of the training time window
+def getWarmStartKey (spec, cTs, trainingTimePeriod, basePopulationSensorRef):
+    timePeriodFilters = {k: v for k, v in trainingTimePeriod.items () if k not in ['from', 'to']}
+    return json.dumps ([spec, [cT.id for cT in cTs], timePeriodFilters, basePopulationSensorRef], sort_keys=True, default=str)
+
+# number of threads computing the views of a getMultiSourceTrack request with several viewTypes
+ANALYSIS_VIEW_THREADS = 4
+
+# number of measurements fetched at once from the database cursor (and written to the response at once) by the exports
+EXPORT_CHUNK_SIZE = 5000
+
+# number of measurements per row group of the Parquet export
+EXPORT_ROW_GROUP_SIZE = 100000
+
+# columns of the exports (CSV header / Parquet schema / NDJSON keys)
+EXPORT_SCHEMA = pa.schema ([
+    ('sensor_ref', pa.string ()),
+    ('modality', pa.string ()),
+    ('is_reverse_channel', pa.bool_ ()),
+    ('time_period_counter', pa.int32 ()),
+    ('date', pa.date32 ()),
+    ('hour', pa.int32 ()),
+    ('count', pa.float64 ()),
+])
+
+# streamed export file based on selected sensorTracks (cTs) and timePeriods, in the given format ('csv', 'ndjson' or 'parquet'), gzip compressed if requested
+# the measurements are read through a server-side cursor by chunks and sent as they are written, thus the memory use doesn't depend on the size of the export
+# Parquet files are always compressed (per column), the gzip flag is ignored for them
+def extractRawCSVData (cTs, timePeriods, gzip = False, exportFormat = 'csv'):
+    fileName, contentType, iterContent = EXPORT_FORMATS[exportFormat if exportFormat in EXPORT_FORMATS else 'csv']
+    if gzip and exportFormat != 'parquet':
+        response = StreamingHttpResponse (iterGzipped (iterContent (cTs, timePeriods)), content_type='application/gzip')
+        fileName += '.gz'
+    else:
+        response = StreamingHttpResponse (iterContent (cTs, timePeriods), content_type=contentType)
+    response['Content-Disposition'] = 'attachment; filename="' + fileName + '"'
     return response
+
+# chunks of the exported measurements, as (sensorTrack, timePeriodCounter, rows) with at most EXPORT_CHUNK_SIZE (date, hour, count) rows
+def iterExportChunks (cTs, timePeriods):
+    #sensors and modalities of all the tracks in a single query, instead of lazy queries while writing the rows
+    tracks = app.models.SensorTrack.objects.select_related ('sensor', 'modality').in_bulk ([cT.id for cT in cTs])
+    for cT in cTs:
+        cT = tracks[cT.id]
+        for timePeriodCounter, timePeriod in enumerate(timePeriods):
+            hMeasurements = filterMeasurementsForTimePeriod(cT.hMeasurements, timePeriod, cT).exclude(count=float('nan')).values_list ('date', 'hour', 'count')
+            rows = []
+            for row in hMeasurements.iterator (chunk_size = EXPORT_CHUNK_SIZE):
+                rows.append (row)
+                if len (rows) == EXPORT_CHUNK_SIZE:
+                    yield cT, timePeriodCounter, rows
+                    rows = []
+            if rows:
+                yield cT, timePeriodCounter, rows
+
+# numpy columns (see EXPORT_SCHEMA) of a chunk of exported measurements
+def getExportColumns (cT, timePeriodCounter, rows):
+    dates, hours, counts = zip (*rows)
+    return {
+        'sensor_ref': np.full (len (rows), cT.sensor.ref, dtype=object),
+        'modality': np.full (len (rows), cT.modality.name, dtype=object),
+        'is_reverse_channel': np.full (len (rows), cT.isReverseChannel),
+        'time_period_counter': np.full (len (rows), timePeriodCounter, dtype=np.int32),
+        'date': toDays (dates),
+        'hour': np.array (hours, dtype=np.int32),
+        'count': np.array (counts, dtype=float),
+    }
+
+# file-like object returning the written line, to produce the CSV lines with csv.writer without buffering them
+class CSVLineBuffer:
+    def write (self, value):
+        return value
+
+# CSV lines of the export, grouped by chunks of EXPORT_CHUNK_SIZE lines
+def iterRawCSVData (cTs, timePeriods):
+    writer = csv.writer (CSVLineBuffer ())
+    yield writer.writerow (EXPORT_SCHEMA.names)
+    for cT, timePeriodCounter, rows in iterExportChunks (cTs, timePeriods):
+        prefix = [cT.sensor.ref, cT.modality.name, cT.isReverseChannel, timePeriodCounter]
+        yield ''.join (writer.writerow (prefix + [date.strftime ("%Y-%m-%d"), hour, count]) for date, hour, count in rows)
+
+# JSON lines of the export (an object per measurement), serialized by chunks from the columns
+def iterRawNDJSONData (cTs, timePeriods):
+    for cT, timePeriodCounter, rows in iterExportChunks (cTs, timePeriods):
+        columns = getExportColumns (cT, timePeriodCounter, rows)
+        columns['date'] = np.datetime_as_string (columns['date'], unit='D')
+        yield pd.DataFrame (columns).to_json (orient='records', lines=True, double_precision=15).rstrip ('\n') + '\n'
+
+# output stream of the Parquet writer, emptied after each written row group
+class ExportBuffer:
+    def __init__ (self):
+        self.chunks = []
+        self.closed = False
+
+    def write (self, data):
+        self.chunks.append (bytes (data))
+        return len (data)
+
+    def flush (self):
+        pass
+
+    def drain (self):
+        res = b''.join (self.chunks)
+        self.chunks = []
+        return res
+
+# Parquet file of the export, with row groups of about EXPORT_ROW_GROUP_SIZE measurements
+def iterRawParquetData (cTs, timePeriods):
+    buffer = ExportBuffer ()
+    writer = pq.ParquetWriter (buffer, EXPORT_SCHEMA)
+    tables = []
+    rowCount = 0
+    for cT, timePeriodCounter, rows in iterExportChunks (cTs, timePeriods):
+        tables.append (pa.table (getExportColumns (cT, timePeriodCounter, rows), schema=EXPORT_SCHEMA))
+        rowCount += len (rows)
+        if rowCount >= EXPORT_ROW_GROUP_SIZE:
+            writer.write_table (pa.concat_tables (tables), row_group_size=rowCount)
+            tables = []
+            rowCount = 0
+            yield buffer.drain ()
+    if tables:
+        writer.write_table (pa.concat_tables (tables), row_group_size=rowCount)
+    writer.close ()
+    yield buffer.drain ()
+
+# on-the-fly gzip compression of the text chunks
+def iterGzipped (chunks):
+    compressor = zlib.compressobj (wbits = 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress (chunk.encode ('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush ()
     
+# formats of the extractRawCSVData view type: file name, content type, and generator of the content chunks
+EXPORT_FORMATS = {
+    'csv': ('export.csv', 'text/plain', iterRawCSVData),
+    'ndjson': ('export.ndjson', 'application/x-ndjson', iterRawNDJSONData),
+    'parquet': ('export.parquet', 'application/vnd.apache.parquet', iterRawParquetData),
+}
+
 # extraction of the data for the basePopulation (if isBase is selected for some sensor in the frontend)
-def getBasePopulation (timePeriods, basePopulationSensorRef, hourly):
+# for each time window, the sum of the tracks of the base sensor as a TrackSeries (HourlyTrackSeries if hourly), without the zero counts
+# the views divide their series by it with TrackSeries.divide, which drops the days (hours) missing from the base population
+# computed once per loader, thus shared by the views of a multi-view request
+def getBasePopulation (timePeriods, basePopulationSensorRef, hourly, loader):
     if not basePopulationSensorRef:
         return None
+    return loader.memoize (('basePopulation', basePopulationSensorRef, hourly), lambda: buildBasePopulation (timePeriods, basePopulationSensorRef, hourly, loader))
+
+def buildBasePopulation (timePeriods, basePopulationSensorRef, hourly, loader):
     cSensor = app.models.Sensor.objects.filter (ref=basePopulationSensorRef).first ()
     if not cSensor:
         return None
+    baseTracks = list (cSensor.tracks.all ())
+    loader.addTracks (baseTracks)
     res = {}
     for timePeriodCounter, timePeriod in enumerate(timePeriods):
         if hourly:
-            res[timePeriodCounter] = defaultdict (lambda: defaultdict(float))
-            for cT in cSensor.tracks.all ():
-                measurements = filterMeasurementsForTimePeriod(cT.hMeasurements, timePeriod, cT).exclude(count=float('nan')).values ('date', 'count', "hour")
-                for dM in measurements:
-                    res[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")][dM['hour']] += dM['count']
-            for d in res[timePeriodCounter]:
-                res[timePeriodCounter][d] = {k:v for k,v in res[timePeriodCounter][d].items() if v != 0}
-            res[timePeriodCounter] = {k:v for k,v in res[timePeriodCounter].items() if len(v) > 0}
+            res[timePeriodCounter] = HourlyTrackSeries.sum ([loader.getHourly (cT, timePeriodCounter) for cT in baseTracks])
         else:
-            res[timePeriodCounter] = defaultdict (float)
-            for cT in cSensor.tracks.all ():
-                measurements = filterMeasurementsForTimePeriod(cT.dMeasurements, timePeriod, cT).values ('date', 'count_sum')
-                for dM in measurements:
-                    res[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")] += dM['count_sum']
-            res[timePeriodCounter] = {k:v for k,v in res[timePeriodCounter].items() if v != 0}
+            res[timePeriodCounter] = TrackSeries.sum ([loader.getDaily (cT, timePeriodCounter) for cT in baseTracks])
     return res    
     
 # the following views all have the same params - configuration of the sensors/timewindows + interface params like language
 # they create a collection of primitive views to show in the frontend in the dedicated tab of the analysis page
 
 # summary: raw graph + basic statistics
-def getSummaryView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang):
-    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False)
+def getSummaryView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang, loader = None):
+    loader = loader or MeasurementsLoader (cTs, timePeriods)
+    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False, loader)
     respContent = []
     lines = []
     stats = []
     percentiles = [5, 25, 50, 75, 95]
-    dateToTrackToCount = defaultdict(lambda: [0]*len(cTs)*len(timePeriods))
     for cTCounter, cT in enumerate(cTs):
         for timePeriodCounter, timePeriod in enumerate(timePeriods):
-            dMeasurements = filterMeasurementsForTimePeriod(cT.dMeasurements, timePeriod, cT).values ('date', 'count_sum') 
+            dMeasurements = loader.getDaily (cT, timePeriodCounter)
             if basePopulation:
-                dMeasurements = [{'date':dM['date'], 'count_sum': dM['count_sum'] / basePopulation[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")]} for dM in dMeasurements if dM['date'].strftime ("%Y-%m-%d") in basePopulation[timePeriodCounter]]
-            for dM in dMeasurements:
-                dateToTrackToCount[dM['date'].strftime ("%Y-%m-%d")][cTCounter * len(timePeriods) + timePeriodCounter] = dM['count_sum']
+                dMeasurements = dMeasurements.divide (basePopulation[timePeriodCounter])
             if len (dMeasurements) == 0:
                 continue
-            values = [dM['count_sum'] for dM in dMeasurements]
+            values = dMeasurements.values
             stats.append ([cT.nameForGraph (timePeriodCounter, withSensorRefs)] + [formatFloat (np.mean (values))] + [formatFloat (val) for val in np.percentile (values, percentiles).tolist()] + [formatFloat (np.std (values))])
             lines.append ({
-                "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count_sum']} for dM in dMeasurements],
+                "data": dMeasurements.points (),
                 "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                 "colorCounter": cTCounter,
                 "timePeriodCounter": timePeriodCounter
@@ -296,20 +534,24 @@ def getSummaryView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, l
     return respContent
 
 # sensors split: relative counts for selected sensors
-def getSplitView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang):
+def getSplitView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang, loader = None):
+    loader = loader or MeasurementsLoader (cTs, timePeriods)
     respContent = []
-    dateToTrackToCount = defaultdict(lambda: [0]*len(cTs)*len(timePeriods))
-    for cTCounter, cT in enumerate(cTs):
-        for timePeriodCounter, timePeriod in enumerate(timePeriods):
-            dMeasurements = filterMeasurementsForTimePeriod(cT.dMeasurements, timePeriod, cT).values ('date', 'count_sum') 
-            for dM in dMeasurements:
-                dateToTrackToCount[dM['date'].strftime ("%Y-%m-%d")][cTCounter * len(timePeriods) + timePeriodCounter] = dM['count_sum']
+    allSeries = [loader.getDaily (cT, timePeriodCounter) for cT in cTs for timePeriodCounter in range (len (timePeriods))]
     if len(cTs) > 1:
+        #days x (track, time window) matrix of the counts, 0 when missing, and the cumulated percentages of the days with counts
+        days = np.unique (np.concatenate ([series.days for series in allSeries]))
+        counts = np.zeros ((len (days), len (allSeries)))
+        for seriesCounter, series in enumerate (allSeries):
+            counts[np.searchsorted (days, series.days), seriesCounter] = series.values
+        totals = counts.sum (axis=1)
+        hasCounts = totals > 0
+        percentages = TrackSeries (days[hasCounts], 100 * np.cumsum (counts[hasCounts], axis=1) / totals[hasCounts, None])
         lines = []
         for cTCounter, cT in enumerate (cTs):
             for timePeriodCounter, timePeriod in enumerate(timePeriods):
                 lines.append ({
-                        "data": [{"x":dateString, "y":100 * sum (dateToTrackToCount[dateString][:cTCounter * len(timePeriods) + timePeriodCounter + 1]) / sum (dateToTrackToCount[dateString])} for dateString in sorted (dateToTrackToCount.keys()) if sum (dateToTrackToCount[dateString]) > 0],
+                        "data": TrackSeries (percentages.days, percentages.values[:, cTCounter * len(timePeriods) + timePeriodCounter]).points (),
                         "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                         "fill": str(-len(timePeriods)) if cTCounter >= 1 else "origin",
                         "colorCounter": cTCounter,
@@ -338,7 +580,8 @@ def getSplitView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lan
     return respContent
 
 # visualisation of number of counts returned by the sensor + tests scores
-def getDataQualityView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang):
+def getDataQualityView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang, loader = None):
+    loader = loader or MeasurementsLoader (cTs, timePeriods)
     respContent = []
     respContent.append ({
         "type": 'lineChart',
@@ -364,12 +607,13 @@ def getDataQualityView (cTs, timePeriods, withSensorRefs, basePopulationSensorRe
             qualityValidationResultsDic[qvr['date']][qvr['test__name']] = qvr["passed"]
         
         for timePeriodCounter, timePeriod in enumerate(timePeriods):
-            dMeasurements = filterMeasurementsForTimePeriod(cT.dMeasurements, timePeriod, cT).values ('date', 'count_sum', "count")
-            tooltips = [[test + ": " + str(qualityValidationResultsDic[dm['date']][test]  ) for test in testNames]  for dm in dMeasurements]
-            passedRatios = [sum (qualityValidationResultsDic[dm['date']].values()) for dm in dMeasurements]
+            dMeasurements = loader.getDaily (cT, timePeriodCounter, 'count')
+            dates = dMeasurements.dates ()
+            tooltips = [[test + ": " + str(qualityValidationResultsDic[date][test]  ) for test in testNames]  for date in dates]
+            passedRatios = [sum (qualityValidationResultsDic[date].values()) for date in dates]
             colors = ['RGB(' + str(int (255-255*(pr / len(testNames)))) + ',' + str(int (255*(pr / len(testNames)))) + ',0)' for pr in passedRatios]
             respContent[0]["lines"].append ({
-                "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count']} for dM in dMeasurements],
+                "data": dMeasurements.points (),
                 "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                 "tooltips": tooltips,
                 "pointColors": colors,
@@ -383,8 +627,9 @@ def getDataQualityView (cTs, timePeriods, withSensorRefs, basePopulationSensorRe
 # for each hour:
 # - graph of evolution at different dates
 # - if 2 or more timePeriods - statistically significant difference tests with map and table visualisations
-def getDailyProfilesView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang):
-    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, True)
+def getDailyProfilesView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang, loader = None):
+    loader = loader or MeasurementsLoader (cTs, timePeriods)
+    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, True, loader)
     respContent = []
     respContent.append ({
         "type": 'scatterChart',
@@ -396,27 +641,25 @@ def getDailyProfilesView (cTs, timePeriods, withSensorRefs, basePopulationSensor
     })
     noDataTracks = []
     noDataWithBaseTracks = []
+    #hourly series of the tracks in the time windows, divided by the base population if any
+    normalizedHMeasurements = {}
     for cTCounter,cT in enumerate(cTs):
         for timePeriodCounter, timePeriod in enumerate(timePeriods):
-            hMeasurements = filterMeasurementsForTimePeriod(cT.hMeasurements, timePeriod, cT).exclude(count=float('nan')).values ('date', 'count', "hour")
+            hMeasurements = loader.getHourly (cT, timePeriodCounter)
             if len (hMeasurements) == 0:
                 noDataTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
             else:
                 if basePopulation:
-                    hMeasurements = [{'date':dM['date'], 'hour':dM['hour'], 'count': dM['count'] / basePopulation[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")][dM['hour']]} for dM in hMeasurements if (dM['date'].strftime ("%Y-%m-%d") in basePopulation[timePeriodCounter]) and (dM['hour'] in basePopulation[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")]) ]
+                    hMeasurements = hMeasurements.divide (basePopulation[timePeriodCounter])
+                normalizedHMeasurements[(cT.id, timePeriodCounter)] = hMeasurements
                 if len (hMeasurements) == 0:
                     noDataWithBaseTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
                 else:
-                    hToDateMeasurements = defaultdict (list)
-                    for hm in hMeasurements:
-                        hToDateMeasurements[hm['hour']].append (hm)
-
                     data = []
                     tooltips = []
-                    for h in sorted (hToDateMeasurements.keys ()):
-                        mean = np.mean ([hm['count'] for hm in hToDateMeasurements[h]])
+                    for h, mean, samples in hMeasurements.hourlyMeans ():
                         data.append ({"x":h, "y": mean})
-                        tooltips.append (["Mean: " + str (mean), "Based on " + str (len(hToDateMeasurements[h])) + ' samples', cT.nameForGraph (timePeriodCounter, withSensorRefs)])
+                        tooltips.append (["Mean: " + str (mean), "Based on " + str (samples) + ' samples', cT.nameForGraph (timePeriodCounter, withSensorRefs)])
                     
                     respContent[0]["lines"].append ({
                         "data": data,
@@ -462,19 +705,19 @@ def getDailyProfilesView (cTs, timePeriods, withSensorRefs, basePopulationSensor
         for cTCounter, cT in enumerate(cTs):
             allMeasurements.append ({'track': cT, 'measurements': []})
             for timePeriodCounter, timePeriod in enumerate(timePeriods):
-                hMeasurements = filterMeasurementsForTimePeriod(cT.hMeasurements, timePeriod, cT).filter (hour=h).exclude(count=float('nan')).values ('date', 'count')
+                hMeasurements = loader.getHourly (cT, timePeriodCounter, h)
                 if len (hMeasurements) == 0:
                     noDataTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
                 else:
                     if basePopulation:
-                        hMeasurements = [{'date':dM['date'], 'count': dM['count'] / basePopulation[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")][h]} for dM in hMeasurements if (dM['date'].strftime ("%Y-%m-%d") in basePopulation[timePeriodCounter]) and (h in basePopulation[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")]) ]
+                        hMeasurements = normalizedHMeasurements[(cT.id, timePeriodCounter)].hour (h)
                     if len (hMeasurements) == 0:
                         noDataWithBaseTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
                     else:
                         hasData = True
-                        allMeasurements[-1]['measurements'].append ((timePeriodCounter, [d['count'] for d in hMeasurements] ))
+                        allMeasurements[-1]['measurements'].append ((timePeriodCounter, hMeasurements.values))
                         cGraph["lines"].append ({
-                            "data": [{"x":hm['date'].strftime ("%Y-%m-%d") + " " + str(h) + ":00:00", "y":hm["count"]} for hm in hMeasurements],
+                            "data": hMeasurements.points (" " + str(h) + ":00:00"),
                             "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                             "colorCounter": cTCounter,
                             "timePeriodCounter": timePeriodCounter
@@ -594,8 +837,9 @@ def getDailyProfilesView (cTs, timePeriods, withSensorRefs, basePopulationSensor
     return respContent
 
 # split in trend/weekly/residuals graphs
-def getTrendView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang):
-    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False)
+def getTrendView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang, loader = None):
+    loader = loader or MeasurementsLoader (cTs, timePeriods)
+    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False, loader)
     respContent = []
     lines = []
     trends = []
@@ -606,17 +850,17 @@ def getTrendView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lan
     noDataWithBaseTracks = []
     for cTCounter, cT in enumerate(cTs):
         for timePeriodCounter, timePeriod in enumerate(timePeriods):
-            dMeasurements = filterMeasurementsForTimePeriod(cT.dMeasurements, timePeriod, cT).values ('date', 'count_sum') 
+            dMeasurements = loader.getDaily (cT, timePeriodCounter)
             if len (dMeasurements) == 0:
                 noDataTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
             else:
                 if basePopulation:
-                    dMeasurements = [{'date':dM['date'], 'count_sum': dM['count_sum'] / basePopulation[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")]} for dM in dMeasurements if dM['date'].strftime ("%Y-%m-%d") in basePopulation[timePeriodCounter]]
+                    dMeasurements = dMeasurements.divide (basePopulation[timePeriodCounter])
                 if len (dMeasurements) == 0:
                     noDataWithBaseTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
                 else:
                     lines.append ({
-                            "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count_sum']} for dM in dMeasurements],
+                            "data": dMeasurements.points (),
                             "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                             "colorCounter": cTCounter,
                             "timePeriodCounter": timePeriodCounter
@@ -624,19 +868,19 @@ def getTrendView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lan
                     if len (dMeasurements) >= 14:
                         decompose, reconstructedDF = getTrueSeasonalDecompose (dMeasurements)
                         trends.append ({
-                            "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['trend']} for _ , dM in decompose.iterrows()],
+                            "data": getPandasPoints (decompose.set_index ('date')['trend']),
                             "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                             "colorCounter": cTCounter,
                             "timePeriodCounter": timePeriodCounter
                         })
                         seasonals.append ({
-                            "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['seasonal']} for _ , dM in decompose.iterrows()],
+                            "data": getPandasPoints (decompose.set_index ('date')['seasonal']),
                             "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                             "colorCounter": cTCounter,
                             "timePeriodCounter": timePeriodCounter
                         })
                         residuals.append ({
-                            "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['resid']} for _ , dM in decompose.iterrows()],
+                            "data": getPandasPoints (decompose.set_index ('date')['resid']),
                             "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                             "colorCounter": cTCounter,
                             "timePeriodCounter": timePeriodCounter
@@ -717,8 +961,9 @@ def getTrendView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lan
     return respContent
 
 # statistical tests for difference on a daily level for 2 time periods
-def getDailyLevelDifferenceView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang):
-    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False)
+def getDailyLevelDifferenceView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang, loader = None):
+    loader = loader or MeasurementsLoader (cTs, timePeriods)
+    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False, loader)
     respContent = []
     lines = []   
     representativityAnalysisDiff = {
@@ -754,16 +999,16 @@ def getDailyLevelDifferenceView (cTs, timePeriods, withSensorRefs, basePopulatio
     noDataWithBaseTracks = []
     for cTCounter, cT in enumerate(cTs):
         for timePeriodCounter, timePeriod in enumerate(timePeriods):
-            dMeasurements = filterMeasurementsForTimePeriod(cT.dMeasurements, timePeriod, cT).values ('date', 'count_sum') 
+            dMeasurements = loader.getDaily (cT, timePeriodCounter)
             if len (dMeasurements) == 0:
                 noDataTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
             else:
                 if basePopulation:
-                    dMeasurements = [{'date':dM['date'], 'count_sum': dM['count_sum'] / basePopulation[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")]} for dM in dMeasurements if dM['date'].strftime ("%Y-%m-%d") in basePopulation[timePeriodCounter]]
+                    dMeasurements = dMeasurements.divide (basePopulation[timePeriodCounter])
                     if len (dMeasurements) == 0:
                         noDataWithBaseTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
             lines.append ({
-                    "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count_sum']} for dM in dMeasurements],
+                    "data": dMeasurements.points (),
                     "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                     "colorCounter": cTCounter,
                     "timePeriodCounter": timePeriodCounter
@@ -772,8 +1017,8 @@ def getDailyLevelDifferenceView (cTs, timePeriods, withSensorRefs, basePopulatio
                 if timePeriodCounter == 0:
                     prevTWMeasurements = dMeasurements
                 else:
-                    aM = [d['count_sum'] for d in prevTWMeasurements]
-                    aM2 = [d['count_sum'] for d in dMeasurements]
+                    aM = prevTWMeasurements.values
+                    aM2 = dMeasurements.values
                     if (len (aM) > 0) and (len (aM2) > 0):
                         ks = kstest (aM, aM2)[1]
                         segmentTitle = cT.modality.name + (" reverse" if cT.isReverseChannel else "")
@@ -850,7 +1095,9 @@ def getDailyLevelDifferenceView (cTs, timePeriods, withSensorRefs, basePopulatio
     return respContent
 
 # temporal extrapolation (uses timePeriod 1 to extrapolate to timePeriod 2) based on a single track
-def getSSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang):
+# engine is one of app.forecasting.EXTRAPOLATION_ENGINES
+def getSSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang, loader = None, engine = app.forecasting.SARIMAX_ENGINE):
+    loader = loader or MeasurementsLoader (cTs, timePeriods)
     if len (timePeriods) != 2:
         return [{
                 "type": 'text',
@@ -881,7 +1128,7 @@ def getSSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
             "subtitle": getTranslatedString ("Time window 2 ends before its start. Please correct", lang),
             "isError": True
         }]
-    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False)
+    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False, loader)
     respContent = []
     ssExtrapolationHadNotEnoughData = False
     ssExtrapolationLines = []
@@ -889,50 +1136,66 @@ def getSSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
     noDataTracks = []
     noDataWithBaseTracks = []
     notEnoughData = []
+    #the models are fitted in parallel once all the lines are known, the prediction lines are filled in afterwards
+    fits = []
+    smoothingSeries = []
+    predictionLines = []
+    dataVersions = getDataVersions (cTs, basePopulationSensorRef)
     for cTCounter, cT in enumerate(cTs):
         allMeasurements.append ([])
         for timePeriodCounter, timePeriod in enumerate(timePeriods):
-            dMeasurements = filterMeasurementsForTimePeriod(cT.dMeasurements, timePeriod, cT).values ('date', 'count_sum') 
+            dMeasurements = loader.getDaily (cT, timePeriodCounter)
             allMeasurements[-1].append (dMeasurements)
             if len (dMeasurements) == 0:
                 noDataTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
             else:
                 if basePopulation:
-                    dMeasurements = [{'date':dM['date'], 'count_sum': dM['count_sum'] / basePopulation[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")]} for dM in dMeasurements if dM['date'].strftime ("%Y-%m-%d") in basePopulation[timePeriodCounter]]
+                    dMeasurements = dMeasurements.divide (basePopulation[timePeriodCounter])
                 if len (dMeasurements) == 0:
                     noDataWithBaseTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
                 else:
                     if timePeriodCounter == 0:  
-                        if (len (dMeasurements) >= 14) and (tp2From.date () > min (dM['date'] for dM in dMeasurements)):
+                        if (len (dMeasurements) >= 14) and (np.datetime64 (tp2From.date ()) > dMeasurements.days[0]):
                             decompose, reconstructedDF = getTrueSeasonalDecompose (dMeasurements)
                             ssExtrapolationLines.append ({
-                                "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count_sum']} for dM in dMeasurements],
+                                "data": dMeasurements.points (),
                                 "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                                 "colorCounter": cTCounter,
                                 "timePeriodCounter": timePeriodCounter
                             })
-                            model = SARIMAX(reconstructedDF['countSum'], order=(0,1,0),seasonal_order=(1,1,1,7), freq='D').fit(disp=0)
-                            prediction = model.predict (start=tp2From.strftime ("%Y-%m-%d"), end=tp2To.strftime ("%Y-%m-%d"))
-                            ssExtrapolationLines.append ({
-                                "data": [{"x":k.strftime ("%Y-%m-%d"), "y":v} for k,v in prediction.items()],
+                            if engine == app.forecasting.SARIMAX_ENGINE:
+                                fits.append ({'series': reconstructedDF['countSum'], 'spec': app.forecasting.WEEKLY_SARIMAX, 'start': tp2From.strftime ("%Y-%m-%d"), 'end': tp2To.strftime ("%Y-%m-%d"),
+                                    'cacheKey': getFittedModelKey (app.forecasting.WEEKLY_SARIMAX, [cT], timePeriods[0], basePopulationSensorRef, dataVersions),
+                                    'warmStartKey': getWarmStartKey (app.forecasting.WEEKLY_SARIMAX, [cT], timePeriods[0], basePopulationSensorRef)})
+                            else:
+                                smoothingSeries.append (dMeasurements)
+                            predictionLines.append ({
+                                "data": None,
                                 "label": cT.nameForGraph (timePeriodCounter + 1, withSensorRefs) + " prediction",
                                 "colorCounter": cTCounter,
                                 "timePeriodCounter": 2
                             })
+                            ssExtrapolationLines.append (predictionLines[-1])
                         else:
                             notEnoughData.append (cT.nameForGraph (-1, withSensorRefs))
                     else:
                         ssExtrapolationLines.append ({
-                            "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count_sum']} for dM in dMeasurements],
+                            "data": dMeasurements.points (),
                             "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                             "colorCounter": cTCounter,
                             "timePeriodCounter": timePeriodCounter
                             })
+    if engine == app.forecasting.SARIMAX_ENGINE:
+        timedOutTracks = fillPredictionLines (predictionLines, fits)
+    else:
+        timedOutTracks = []
+        fillSmoothingPredictionLines (engine, predictionLines, smoothingSeries, tp2From, tp2To)
+    ssExtrapolationLines = [line for line in ssExtrapolationLines if line["data"] is not None]
     if len(ssExtrapolationLines) > 0:
         respContent.append ({
             "type": 'lineChart',
             "title": getTranslatedString ('Total daily counts', lang) + (getTranslatedString (" (divided by the corresponding count of your selected base sensor)", lang) if basePopulation else ""),
-            "subtitle": getTranslatedString ('''Here we use the information from the time window 1 to extrapolate the signal to the time window 2. <br/>
+            "subtitle": (getSmoothingEngineDescription (engine, lang) if engine != app.forecasting.SARIMAX_ENGINE else "") + getTranslatedString ('''Here we use the information from the time window 1 to extrapolate the signal to the time window 2. <br/>
                                                 Each sensor track is treated separately.<br/>
                                                 If there is any data available for time window 2 it is also shown for comparison.
                                                 Extrapolation itself is done using the SARIMAX methodology <span class="questionMark">?<div class="hint">The method belongs to the <a href="https://en.wikipedia.org/wiki/Autoregressive_integrated_moving_average" target="_blank">Autoregressive integrated moving average</a> family. This method tries to learn how the signal evolves and pays attention to both the seasonality effects (weekly patterns in our case) and the so-called non-stationarity (the fact that average values can evolve in time - have a look at the trend analysis tab). For more details it is better to check the link in this popup</div></span><br/>
@@ -947,6 +1210,8 @@ def getSSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
                         "subtitle": getTranslatedString ("For the following sensors in the timewindow 1 we have less than 14 days of measurements, which are needed for extrapolation: <br/>", lang) + "<br/>".join (notEnoughData),
                         "isError": True
                 })
+    if len(timedOutTracks) > 0:
+        respContent.insert (0, getFitTimedOutItem (timedOutTracks, lang))
     if len(noDataWithBaseTracks) > 0:
         respContent.insert (0, {
                         "type": 'text',
@@ -965,7 +1230,8 @@ def getSSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
     
 # temporal extrapolation (uses timePeriod 1 to extrapolate to timePeriod 2) based on a the track history + information from other tracks
 # with and without weekly patterns imposed
-def getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang):
+def getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang, loader = None):
+    loader = loader or MeasurementsLoader (cTs, timePeriods)
     if len (timePeriods) != 2:
         return [{
                 "type": 'text',
@@ -989,7 +1255,7 @@ def getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
             "subtitle": getTranslatedString ("We only predict to the future based on historical data, thus time window 2 can't be partially before the time window 1. Please correct", lang),
             "isError": True
         }]
-    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False)
+    basePopulation = getBasePopulation (timePeriods, basePopulationSensorRef, False, loader)
     respContent = []
     msExtrapolation = {"title": "",
             "subtitle": getTranslatedString ('''Here we use the information from the time window 1 to extrapolate the signal to the time window 2. <br/>
@@ -1000,6 +1266,10 @@ def getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
             "children":[]}
     msExtrapolationLines = []  
     msExtrapolationLinesNoWeekly = []  
+    #the models are fitted in parallel once all the lines are known, the prediction lines are filled in afterwards
+    fits = []
+    predictionLines = []
+    dataVersions = getDataVersions (cTs, basePopulationSensorRef)
     allMeasurements = []
     noDataTracks = []
     noDataWithBaseTracks = []
@@ -1007,13 +1277,13 @@ def getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
     for cTCounter, cT in enumerate(cTs):
         allMeasurements.append ([])
         for timePeriodCounter, timePeriod in enumerate(timePeriods):
-            dMeasurements = filterMeasurementsForTimePeriod(cT.dMeasurements, timePeriod, cT).values ('date', 'count_sum') 
+            dMeasurements = loader.getDaily (cT, timePeriodCounter)
             allMeasurements[-1].append (dMeasurements)
             if len (dMeasurements) == 0:
                 noDataTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
             else:
                 if basePopulation:
-                    dMeasurements = [{'date':dM['date'], 'count_sum': dM['count_sum'] / basePopulation[timePeriodCounter][dM['date'].strftime ("%Y-%m-%d")]} for dM in dMeasurements if dM['date'].strftime ("%Y-%m-%d") in basePopulation[timePeriodCounter]]
+                    dMeasurements = dMeasurements.divide (basePopulation[timePeriodCounter])
                 if len (dMeasurements) == 0:
                     noDataWithBaseTracks.append (cT.nameForGraph (timePeriodCounter, withSensorRefs))
                 elif len (dMeasurements) < 14 and timePeriodCounter == 0:
@@ -1022,14 +1292,16 @@ def getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
         if len (allMeasurements[predictionTrackCounter][0]) < 14:
             continue
         cT = cTs[predictionTrackCounter]
+        #predicted track, then the supporting tracks
+        modelTracks = [cT] + [supportTrack for supportTrackCounter, supportTrack in enumerate (cTs) if supportTrackCounter != predictionTrackCounter]
         msExtrapolationLines.append ({
-            "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count_sum']} for dM in allMeasurements[predictionTrackCounter][0]],
+            "data": allMeasurements[predictionTrackCounter][0].points (),
             "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
             "colorCounter": predictionTrackCounter,
             "timePeriodCounter": 0
         })
         msExtrapolationLines.append ({
-            "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count_sum']} for dM in allMeasurements[predictionTrackCounter][1]],
+            "data": allMeasurements[predictionTrackCounter][1].points (),
             "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
             "colorCounter": predictionTrackCounter,
             "timePeriodCounter": 1
@@ -1044,38 +1316,40 @@ def getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
                 continue
             supportLabels.append (str(supportTrackCounter))
             if len(allMeasurements[supportTrackCounter][0]) > 0:
-                mean = np.mean ([dM['count_sum'] for dM in allMeasurements[supportTrackCounter][0]]) 
+                mean = np.mean (allMeasurements[supportTrackCounter][0].values) 
             else:
                 mean = np.mean ([dM['count_sum'] for dM in cTs[supportTrackCounter].dMeasurements.values ('count_sum')]) 
             for part in [0,1]:
-                dateToCount = defaultdict(lambda:mean)
-                for dM in allMeasurements[supportTrackCounter][part]:
-                    dateToCount[(dM['date']).strftime ("%Y-%m-%d")] = dM['count_sum'] # - timedelta(days=1) !important! timedelta is shifting the date axis by 1 in order to use current value of the supporting track and not the previous one
-                supportSeriesLists[part].append ([dateToCount[k.strftime ("%Y-%m-%d")] if k.strftime ("%Y-%m-%d") in dateToCount else (mean + randint (-1,1)) for k in supportDates[part]]) #randint is used to have some variability around the mean - otherwise arima fails.
+                # !important! the support counts are aligned on the same date (not shifted by a day) in order to use current value of the supporting track and not the previous one
+                supportCounts = allMeasurements[supportTrackCounter][part].toPandas ().reindex (supportDates[part]).tolist ()
+                supportSeriesLists[part].append ([(mean + randint (-1,1)) if np.isnan (count) else count for count in supportCounts]) #randint is used to have some variability around the mean - otherwise arima fails.
         supportDataFrames = [ pd.DataFrame(np.column_stack(supportSeriesLists[part]), index=supportDates[part], columns=supportLabels) for part in [0,1] ]
-        model = SARIMAX(reconstructedDF['countSum'], order=(0,1,0),seasonal_order=(1,1,1,7), freq='D', exog=supportDataFrames[0]).fit(disp=0)
         start = tp2From.strftime ("%Y-%m-%d") if tp2From >= min(supportDates[0]) else min(supportDates[0]).strftime ("%Y-%m-%d")
-        prediction = model.predict (start=start, end=tp2To.strftime ("%Y-%m-%d"), exog=supportDataFrames[1])
-        msExtrapolationLines.append ({
-            "data": [{"x":k.strftime ("%Y-%m-%d"), "y":v} for k,v in prediction.items()],
+        fits.append ({'series': reconstructedDF['countSum'], 'spec': app.forecasting.WEEKLY_SARIMAX, 'start': start, 'end': tp2To.strftime ("%Y-%m-%d"), 'exog': supportDataFrames[0], 'predictExog': supportDataFrames[1],
+            'cacheKey': getFittedModelKey (app.forecasting.WEEKLY_SARIMAX, modelTracks, timePeriods[0], basePopulationSensorRef, dataVersions),
+            'warmStartKey': getWarmStartKey (app.forecasting.WEEKLY_SARIMAX, modelTracks, timePeriods[0], basePopulationSensorRef)})
+        predictionLines.append ({
+            "data": None,
             "label": cT.nameForGraph (timePeriodCounter + 1, withSensorRefs) + " prediction",
             "colorCounter": predictionTrackCounter,
             "timePeriodCounter": 2
         })
+        msExtrapolationLines.append (predictionLines[-1])
     emptyTracks = []
     for predictionTrackCounter in range(len (allMeasurements)):
         cT = cTs[predictionTrackCounter]
         if len (allMeasurements[predictionTrackCounter][0]) < 3:
             emptyTracks.append (cT.nameForGraph (-1, withSensorRefs))
         else:
+            modelTracks = [cT] + [supportTrack for supportTrackCounter, supportTrack in enumerate (cTs) if supportTrackCounter != predictionTrackCounter]
             msExtrapolationLinesNoWeekly.append ({
-                "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count_sum']} for dM in allMeasurements[predictionTrackCounter][0]],
+                "data": allMeasurements[predictionTrackCounter][0].points (),
                 "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                 "colorCounter": predictionTrackCounter,
                 "timePeriodCounter": 0
             })
             msExtrapolationLinesNoWeekly.append ({
-                "data": [{"x":dM['date'].strftime ("%Y-%m-%d"), "y":dM['count_sum']} for dM in allMeasurements[predictionTrackCounter][1]],
+                "data": allMeasurements[predictionTrackCounter][1].points (),
                 "label": cT.nameForGraph (timePeriodCounter, withSensorRefs),
                 "colorCounter": predictionTrackCounter,
                 "timePeriodCounter": 1
@@ -1089,22 +1363,27 @@ def getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
                 if supportTrackCounter == predictionTrackCounter:
                     continue
                 supportLabels.append (str(supportTrackCounter))
-                mean = np.mean ([dM['count_sum'] for dM in allMeasurements[supportTrackCounter][0]]) if len (allMeasurements[supportTrackCounter][0]) > 0 else 0
+                mean = np.mean (allMeasurements[supportTrackCounter][0].values) if len (allMeasurements[supportTrackCounter][0]) > 0 else 0
                 for part in [0,1]:
-                    dateToCount = defaultdict(lambda:mean)
-                    for dM in allMeasurements[supportTrackCounter][part]:
-                        dateToCount[(dM['date']).strftime ("%Y-%m-%d")] = dM['count_sum'] # - timedelta(days=1) !important! timedelta is shifting the date axis by 1 in order to use current value of the supporting track and not the previous one
-                    supportSeriesLists[part].append ([dateToCount[k.strftime ("%Y-%m-%d")] for k in supportDates[part]])
+                    # !important! the support counts are aligned on the same date (not shifted by a day) in order to use current value of the supporting track and not the previous one
+                    supportSeriesLists[part].append (allMeasurements[supportTrackCounter][part].toPandas ().reindex (supportDates[part]).fillna (mean).tolist ())
             supportDataFrames = [ pd.DataFrame(np.column_stack(supportSeriesLists[part]), index=supportDates[part], columns=supportLabels) for part in [0,1] ]
-            model = SARIMAX(reconstructedDF['countSum'], order=(0,1,0), freq='D', exog=supportDataFrames[0]).fit(disp=0)
             start = tp2From.strftime ("%Y-%m-%d") if tp2From >= min(supportDates[0]) else min(supportDates[0]).strftime ("%Y-%m-%d")
-            prediction = model.predict (start=start, end=tp2To.strftime ("%Y-%m-%d"), exog=supportDataFrames[1])
-            msExtrapolationLinesNoWeekly.append ({
-                "data": [{"x":k.strftime ("%Y-%m-%d"), "y":v} for k,v in prediction.items()],
+            fits.append ({'series': reconstructedDF['countSum'], 'spec': app.forecasting.NON_SEASONAL_ARIMA, 'start': start, 'end': tp2To.strftime ("%Y-%m-%d"), 'exog': supportDataFrames[0], 'predictExog': supportDataFrames[1],
+                'cacheKey': getFittedModelKey (app.forecasting.NON_SEASONAL_ARIMA, modelTracks, timePeriods[0], basePopulationSensorRef, dataVersions),
+                'warmStartKey': getWarmStartKey (app.forecasting.NON_SEASONAL_ARIMA, modelTracks, timePeriods[0], basePopulationSensorRef)})
+            predictionLines.append ({
+                "data": None,
                 "label": cT.nameForGraph (timePeriodCounter + 1, withSensorRefs) + " prediction",
                 "colorCounter": predictionTrackCounter,
                 "timePeriodCounter": 2
             })
+            msExtrapolationLinesNoWeekly.append (predictionLines[-1])
+    timedOutTracks = fillPredictionLines (predictionLines, fits)
+    msExtrapolationLines = [line for line in msExtrapolationLines if line["data"] is not None]
+    msExtrapolationLinesNoWeekly = [line for line in msExtrapolationLinesNoWeekly if line["data"] is not None]
+    if len(timedOutTracks) > 0:
+        msExtrapolation['children'].append (getFitTimedOutItem (timedOutTracks, lang))
     if len(msExtrapolationLines) > 0:
         msExtrapolation['children'].append ({
             "type": 'text',
@@ -1172,7 +1451,9 @@ def getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSens
     return respContent
 
 # the routine to verify that timePeriods configuration is correct (by itself) and then fill in the analysis outcome depending on the viewType
-def fillSensorTracks (cTs, timePeriods, viewType, withSensorRefs, basePopulationSensorRef, lang):
+# loader is the MeasurementsLoader to use, a new one is created if not set
+# engine is the extrapolation engine of the views accepting it (EXTRAPOLATION_ENGINE_VIEWS), their default one if not set
+def fillSensorTracks (cTs, timePeriods, viewType, withSensorRefs, basePopulationSensorRef, lang, loader = None, engine = None):
     for ic, tp in enumerate(timePeriods):
         tpFrom, tpTo = getFromToFromTimePeriod (tp)
         if not tpFrom:
@@ -1196,92 +1477,49 @@ def fillSensorTracks (cTs, timePeriods, viewType, withSensorRefs, basePopulation
                 "subtitle": getTranslatedString ("Time window ends before its start. Please correct", lang),
                 "isError": True
             }]
+    loader = loader or MeasurementsLoader (cTs, timePeriods)
     result = []
-    if viewType.lower() == 'summary':
+    for view in ANALYSIS_VIEWS.get (viewType.lower(), []):
         try:
-            result += getSummaryView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang)
+            options = {'engine': engine} if engine and view in EXTRAPOLATION_ENGINE_VIEWS else {}
+            result += view (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang, loader, **options)
         except:
             result += [{
                 "type": 'text',
                 "title": getTranslatedString ('Fatal error occured', lang),
                 "subtitle":  getTranslatedString ('Please notify your IT team about the accident and how have you reached it', lang),
-                "isError": True
+                "isError": True,
+                #not cached: the failure can be temporary (e.g. a broken pool of fitting processes, replaced for the next request)
+                "isTransient": True
             }]
             print (traceback.format_exc())
+    return result
+
+# fillSensorTracks for several viewTypes, returned as a viewType -> result dictionary
+# the measurements (and the base population) are loaded once, by a MeasurementsLoader shared by the views, which are computed in parallel by at most ANALYSIS_VIEW_THREADS threads
+def fillSensorTracksForViewTypes (cTs, timePeriods, viewTypes, withSensorRefs, basePopulationSensorRef, lang, engine = None):
+    loader = MeasurementsLoader (cTs, timePeriods)
+    if len (viewTypes) <= 1:
+        return {viewType: fillSensorTracks (cTs, timePeriods, viewType, withSensorRefs, basePopulationSensorRef, lang, loader, engine) for viewType in viewTypes}
+    def fillViewType (viewType):
         try:
-            result += getDataQualityView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang)
-        except:
-            result += [{
-                "type": 'text',
-                "title": getTranslatedString ('Fatal error occured', lang),
-                "subtitle":  getTranslatedString ('Please notify your IT team about the accident and how have you reached it', lang),
-                "isError": True
-            }]
-            print (traceback.format_exc())
-    if viewType.lower() == 'sensors split':
-        try:
-            result += getSplitView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang)
-        except:
-            result += [{
-                "type": 'text',
-                "title": getTranslatedString ('Fatal error occured', lang),
-                "subtitle":  getTranslatedString ('Please notify your IT team about the accident and how have you reached it', lang),
-                "isError": True
-            }]
-            print (traceback.format_exc())
-    if viewType.lower() == 'daily profiles':
-        try:
-            result += getDailyProfilesView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang)
-        except:
-            result += [{
-                "type": 'text',
-                "title": getTranslatedString ('Fatal error occured', lang),
-                "subtitle":  getTranslatedString ('Please notify your IT team about the accident and how have you reached it', lang),
-                "isError": True
-            }]
-            print (traceback.format_exc())
-    if viewType.lower() == 'trend analysis':
-        try:
-            result += getTrendView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang)
-        except:
-            result += [{
-                "type": 'text',
-                "title": getTranslatedString ('Fatal error occured', lang),
-                "subtitle":  getTranslatedString ('Please notify your IT team about the accident and how have you reached it', lang),
-                "isError": True
-            }]
-            print (traceback.format_exc())
-    if viewType.lower() == 'difference on a daily level':
-        try:
-            result += getDailyLevelDifferenceView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang)
-        except:
-            result += [{
-                "type": 'text',
-                "title": getTranslatedString ('Fatal error occured', lang),
-                "subtitle":  getTranslatedString ('Please notify your IT team about the accident and how have you reached it', lang),
-                "isError": True
-            }]
-            print (traceback.format_exc())
-    if viewType.lower() == 'single track extrapolation':
-        try:
-            result += getSSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang)
-        except:
-            result += [{
-                "type": 'text',
-                "title": getTranslatedString ('Fatal error occured', lang),
-                "subtitle":  getTranslatedString ('Please notify your IT team about the accident and how have you reached it', lang),
-                "isError": True
-            }]
-            print (traceback.format_exc())
-    if viewType.lower() == 'multiple tracks extrapolation':
-        try:
-            result += getMSExtrapolationView (cTs, timePeriods, withSensorRefs, basePopulationSensorRef, lang)
-        except:
-            result += [{
-                "type": 'text',
-                "title": getTranslatedString ('Fatal error occured', lang),
-                "subtitle":  getTranslatedString ('Please notify your IT team about the accident and how have you reached it', lang),
-                "isError": True
-            }]
-            print (traceback.format_exc())
-    return result
\ No newline at end of file
+            return fillSensorTracks (cTs, timePeriods, viewType, withSensorRefs, basePopulationSensorRef, lang, loader, engine)
+        finally:
+            #the database connections are opened per thread
+            connections.close_all ()
+    with ThreadPoolExecutor (max_workers = min (ANALYSIS_VIEW_THREADS, len (viewTypes))) as executor:
+        return dict (zip (viewTypes, executor.map (fillViewType, viewTypes)))
+
+# views computed for each viewType (lowercase) of the analysis page
+ANALYSIS_VIEWS = {
+    'summary': [getSummaryView, getDataQualityView],
+    'sensors split': [getSplitView],
+    'daily profiles': [getDailyProfilesView],
+    'trend analysis': [getTrendView],
+    'difference on a daily level': [getDailyLevelDifferenceView],
+    'single track extrapolation': [getSSExtrapolationView],
+    'multiple tracks extrapolation': [getMSExtrapolationView],
+}
+
+# views accepting an extrapolation engine (see app.forecasting.EXTRAPOLATION_ENGINES)
+EXTRAPOLATION_ENGINE_VIEWS = [getSSExtrapolationView]